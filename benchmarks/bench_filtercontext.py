@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""bench_filtercontext
+  Per-image cost of the mapmedia + addimgdims filters
+
+Builds synthetic pandoc ASTs with a growing number of Image nodes,
+writes a matching .media.json, and runs both filters over each AST the
+same way a pandoc --filter process does (settings from the
+environment). With the shared FilterContext the per-image cost should
+stay flat as the image count grows.
+
+example:
+  $ python benchmarks/bench_filtercontext.py -n 10 100 1000 5000
+"""
+
+import argparse
+import functools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from mdutils import pandoc_addimgdims, pandoc_mapmedia, pandoc_pipeline  # noqa: E402
+
+
+def makeDoc(count):
+    blocks = []
+    for i in range(1, count + 1):
+        image = {
+            "t": "Image",
+            "c": [
+                ["", [], [["width", "2in"], ["height", "1in"]]],
+                [{"t": "Str", "c": "figure%d" % i}],
+                ["./media/image%d.png" % i, ""],
+            ],
+        }
+        blocks.append({"t": "Para", "c": [image]})
+    return {"pandoc-api-version": [1, 20], "meta": {}, "blocks": blocks}
+
+
+def makeMedia(workdir, count):
+    srcfolder = os.path.join(workdir, "media")
+    dstfolder = os.path.join(workdir, "img")
+    os.makedirs(srcfolder)
+    os.makedirs(dstfolder)
+    mediamap = {}
+    for i in range(1, count + 1):
+        fn = "image%d.png" % i
+        with open(os.path.join(srcfolder, fn), "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+        mediamap[fn] = fn
+    mediainfopath = os.path.join(workdir, "bench.media.json")
+    with open(mediainfopath, "w") as f:
+        json.dump(
+            {
+                "srcfull": srcfolder,
+                "dstfull": dstfolder,
+                "prefix": "bench",
+                "srcsubstr": "./media/",
+                "dstsubstr": "img/",
+                "map": mediamap,
+            },
+            f,
+        )
+    return mediainfopath
+
+
+def bench(count, repeat):
+    workdir = tempfile.mkdtemp(prefix="bench_filtercontext-")
+    try:
+        os.environ["pandoc_filter_mapmedia"] = makeMedia(workdir, count)
+
+        def run():
+            # A fresh context per run, as in a new pandoc --filter process,
+            # so that every run places the images again
+            context = pandoc_pipeline.FilterContext.fromEnviron()
+            actions = [
+                functools.partial(pandoc_mapmedia.pandoc_wmftosvgpng, context=context),
+                functools.partial(pandoc_addimgdims.pandoc_addimgdims, context=context),
+            ]
+            pandoc_pipeline.applyFilters(makeDoc(count), actions, "markdown")
+
+        best = min(timeit.repeat(run, number=1, repeat=repeat))
+    finally:
+        del os.environ["pandoc_filter_mapmedia"]
+        shutil.rmtree(workdir)
+    return {"images": count, "seconds": best, "us_per_image": best / count * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "-n",
+        "--images",
+        nargs="+",
+        type=int,
+        default=[10, 100, 1000, 5000],
+        help="image counts to measure",
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=3, help="repetitions, best is reported"
+    )
+    parser.add_argument(
+        "--json", action="store_true", default=False, help="print JSON results"
+    )
+    args = parser.parse_args()
+    results = [bench(count, args.repeat) for count in args.images]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(
+                "%(images)8d images  %(seconds)8.4f s  %(us_per_image)8.1f us/image" % r
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,642 @@
+#!/usr/bin/env python
+"""bench_pipeline
+  End-to-end docx to Markdown benchmark with per-stage timing
+
+Generates a synthetic .docx of a controlled size (paragraphs, PNG
+images, vector WMF images and bitmap WMF images), converts it with
+DocxToMdConverter.convertDocxToMd() and records the stage events of
+its tracer (see mdutils/tracing.py): wall time of every stage, and for
+the top-level stages the CPU time of this process and of its children
+(pandoc, java) and peak RSS. Results can be written as JSON and
+compared with an earlier run.
+
+With -i, all runs convert into the same folder after one unmeasured
+full conversion, so that they measure the incremental path; --change
+picks what changes in the .docx before each run: nothing, its mtime,
+or one image.
+
+By default pandoc and java are replaced by the stand-ins in
+benchmarks/stubs, so the suite runs offline and measures docxtomd's own
+overhead. Use --real to run the installed pandoc and wmf2svg instead.
+
+Peak RSS is the high-water mark of the process (and of its waited-for
+children) at the end of each stage, as reported by getrusage(). It is
+cumulative: a stage shows the largest footprint of any stage so far,
+not its own.
+
+examples:
+  $ python benchmarks/bench_pipeline.py -n 2000 -m 50 -k 20 -o before.json
+  $ python benchmarks/bench_pipeline.py -n 2000 -m 50 -k 20 -F -S -W -j 4 \\
+      --compare before.json
+  $ python benchmarks/bench_pipeline.py -F -i --change media
+  $ python benchmarks/bench_pipeline.py --dedupe --compress-svg max \\
+      --optimize-png default
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zipfile
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+STUBS = os.path.join(os.path.dirname(os.path.realpath(__file__)), "stubs")
+
+sys.path.insert(0, ROOT)
+
+from mdutils import docxtomd  # noqa: E402
+
+EMU_PER_PX = 9525
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua"
+).split()
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Default Extension="png" ContentType="image/png"/>
+<Default Extension="wmf" ContentType="image/x-wmf"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""
+
+PACKAGE_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+DOCUMENT = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture">
+<w:body>
+%s
+<w:sectPr/>
+</w:body>
+</w:document>"""
+
+HEADING = (
+    '<w:p><w:pPr><w:pStyle w:val="Heading%d"/></w:pPr><w:r><w:t>%s</w:t></w:r></w:p>'
+)
+PARAGRAPH = '<w:p><w:r><w:t xml:space="preserve">%s</w:t></w:r></w:p>'
+DRAWING = (
+    '<w:p><w:r><w:drawing><wp:inline><wp:extent cx="%(cx)d" cy="%(cy)d"/>'
+    '<wp:docPr id="%(id)d" name="Picture %(id)d" descr="%(descr)s"/>'
+    "<a:graphic>"
+    '<a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+    '<pic:pic><pic:nvPicPr><pic:cNvPr id="%(id)d" name="%(name)s"/><pic:cNvPicPr/>'
+    "</pic:nvPicPr>"
+    '<pic:blipFill><a:blip r:embed="%(rid)s"/><a:stretch><a:fillRect/></a:stretch>'
+    "</pic:blipFill>"
+    '<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="%(cx)d" cy="%(cy)d"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr></pic:pic>'
+    "</a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>"
+)
+IMAGE_REL = (
+    '<Relationship Id="%s" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" '
+    'Target="media/%s"/>'
+)
+
+
+def pngChunk(kind, data):
+    chunk = kind + data
+    return (
+        struct.pack(">I", len(data))
+        + chunk
+        + struct.pack(">I", zlib.crc32(chunk) & 0xFFFFFFFF)
+    )
+
+
+def makePng(width, height, seed):
+    rows = []
+    for y in range(height):
+        rows.append(
+            b"\x00"
+            + bytes(
+                bytearray((x * 7 + y * 3 + seed * 11) % 256 for x in range(width * 3))
+            )
+        )
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + pngChunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + pngChunk(b"IDAT", zlib.compress(b"".join(rows)))
+        + pngChunk(b"IEND", b"")
+    )
+
+
+def wmfRecord(function, params):
+    return struct.pack("<IH", 3 + len(params) // 2, function) + params
+
+
+def makeWmf(width, height, seed, bitmap=False):
+    """
+    Returns:
+        bytes: a placeable WMF with polygons, or with one 24-bit DIB
+    """
+    records = [
+        wmfRecord(0x020B, struct.pack("<hh", 0, 0)),
+        wmfRecord(0x020C, struct.pack("<hh", height, width)),
+    ]
+    if bitmap:
+        w, h = 32, 24
+        stride = (w * 3 + 3) & ~3
+        pixels = b"".join(
+            bytes(bytearray((x + y * 5 + seed) % 256 for x in range(stride)))
+            for y in range(h)
+        )
+        dib = struct.pack(
+            "<IiiHHIIiiII", 40, w, h, 1, 24, 0, len(pixels), 2835, 2835, 0, 0
+        )
+        params = (
+            struct.pack("<IH8h", 0x00CC0020, 0, h, w, 0, 0, height, width, 0, 0)
+            + dib
+            + pixels
+        )
+        records.append(wmfRecord(0x0F43, params))
+    else:
+        for i in range(20):
+            points = []
+            for j in range(8):
+                points.append((seed * 13 + i * 17 + j * 29) % width)
+                points.append((seed * 7 + i * 11 + j * 23) % height)
+            records.append(
+                wmfRecord(0x0324, struct.pack("<h%dh" % len(points), 8, *points))
+            )
+    records.append(wmfRecord(0x0000, b""))
+    body = b"".join(records)
+    maxrecord = max(struct.unpack("<I", r[:4])[0] for r in records)
+    header = struct.pack(
+        "<HHHIHIH", 1, 9, 0x0300, (18 + len(body)) // 2, 0, maxrecord, 0
+    )
+    placeable = struct.pack("<IHhhhhHI", 0x9AC6CDD7, 0, 0, 0, width, height, 1440, 0)
+    checksum = 0
+    for word in struct.unpack("<10H", placeable):
+        checksum ^= word
+    return placeable + struct.pack("<H", checksum) + header + body
+
+
+def makeDocx(path, paragraphs, pngs, wmfs, bitmapwmfs):
+    """
+    Write a .docx with the given number of paragraphs, a heading every
+    20 paragraphs, and the images spread evenly between them.
+    """
+    media = []
+    for i in range(pngs):
+        media.append(("png", makePng(64, 48, i)))
+    for i in range(wmfs):
+        media.append(("wmf", makeWmf(400, 300, i)))
+    for i in range(bitmapwmfs):
+        media.append(("wmf", makeWmf(400, 300, i, bitmap=True)))
+    step = max(1, paragraphs // max(1, len(media)))
+    body = []
+    rels = []
+    nextimage = 0
+    for p in range(max(paragraphs, len(media))):
+        if p % 20 == 0:
+            body.append(
+                HEADING % (1 if p % 100 == 0 else 2, "Section %d" % (p // 20 + 1))
+            )
+        if p < paragraphs:
+            text = " ".join(WORDS[(p + i) % len(WORDS)] for i in range(40))
+            body.append(PARAGRAPH % text)
+        if p % step == 0 and nextimage < len(media):
+            ext, data = media[nextimage]
+            nextimage += 1
+            rid = "rIdImg%d" % nextimage
+            name = "image%d.%s" % (nextimage, ext)
+            rels.append((rid, name, data))
+            body.append(
+                DRAWING
+                % {
+                    "cx": 400 * EMU_PER_PX,
+                    "cy": 300 * EMU_PER_PX,
+                    "id": nextimage,
+                    "descr": "Figure %d" % nextimage,
+                    "name": name,
+                    "rid": rid,
+                }
+            )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", CONTENT_TYPES)
+        archive.writestr("_rels/.rels", PACKAGE_RELS)
+        archive.writestr("word/document.xml", DOCUMENT % "\n".join(body))
+        archive.writestr(
+            "word/_rels/document.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            "<Relationships "
+            'xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(IMAGE_REL % (rid, name) for rid, name, data in rels)
+            + "</Relationships>",
+        )
+        for rid, name, data in rels:
+            archive.writestr("word/media/" + name, data)
+
+
+def changeMedia(docxpath, seed):
+    """
+    Replace the first image of the .docx with a different one of the same
+    type, leaving the text as it is.
+    """
+    tmppath = docxpath + ".tmp"
+    changed = False
+    with zipfile.ZipFile(docxpath) as src:
+        with zipfile.ZipFile(tmppath, "w", zipfile.ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                data = src.read(info)
+                if not changed and info.filename.startswith("word/media/"):
+                    if info.filename.endswith(".png"):
+                        data = makePng(64, 48, 1000 + seed)
+                    else:
+                        data = makeWmf(400, 300, 1000 + seed)
+                    changed = True
+                dst.writestr(info, data)
+    os.rename(tmppath, docxpath)
+
+
+def maxRssKb(usage):
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return usage.ru_maxrss // 1024
+    return usage.ru_maxrss
+
+
+# Stages that follow each other; the others run within media
+TOP_STAGES = (
+    "paths",
+    "manifest",
+    "pandoc_docx_to_json",
+    "media",
+    "pandoc_json_to_md",
+    "html",
+)
+STAGE_ORDER = (
+    TOP_STAGES[:4]
+    + (
+        "media_file",
+        "svg_optimize",
+        "png_optimize",
+    )
+    + TOP_STAGES[4:]
+    + ("document",)
+)
+
+
+class StageRecorder:
+    """
+    Tracer for DocxToMdConverter that adds the CPU time of this process
+    and of its children to the events of the top-level stages, as the
+    difference to the previous top-level stage.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.start = self.last = self.usage()
+
+    def usage(self):
+        return (
+            resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN),
+        )
+
+    def __call__(self, event):
+        if event["event"] in TOP_STAGES or event["event"] == "document":
+            now = self.usage()
+            before = self.start if event["event"] == "document" else self.last
+            event["cpu"] = cpuTime(now[0]) - cpuTime(before[0])
+            event["children_cpu"] = cpuTime(now[1]) - cpuTime(before[1])
+            # High-water marks so far, not of this stage alone
+            event["peak_rss_kb"] = maxRssKb(now[0])
+            event["children_peak_rss_kb"] = maxRssKb(now[1])
+            if event["event"] != "document":
+                self.last = now
+        self.events.append(event)
+
+
+def cpuTime(usage):
+    return usage.ru_utime + usage.ru_stime
+
+
+def convert(docxpath, outdir, opts):
+    """
+    Convert one document with DocxToMdConverter.convertDocxToMd() and
+    collect its trace events.
+
+    Returns:
+        tuple: (list of stage measurements, success, action)
+    """
+    converterOpts = dict(opts)
+    recorder = StageRecorder()
+    converterOpts.update(
+        {
+            "inputpath": docxpath,
+            "outputpath": None,
+            "out_dir": outdir,
+            "tracer": recorder,
+        }
+    )
+    converter = docxtomd.DocxToMdConverter(**converterOpts)
+    converter.convertDocxToMd()
+    stages = {}
+    action = None
+    for event in recorder.events:
+        name = event["event"]
+        if name == "document":
+            action = event.get("action")
+        # Several media_file events per run: their seconds add up
+        stage = stages.setdefault(name, {"stage": name, "wall": 0.0, "count": 0})
+        stage["wall"] += event["seconds"]
+        stage["count"] += 1
+        for key in ("cpu", "children_cpu", "bytes_in", "bytes_out"):
+            if key in event:
+                stage[key] = stage.get(key, 0) + event[key]
+        for key in ("peak_rss_kb", "children_peak_rss_kb"):
+            if key in event:
+                stage[key] = max(stage.get(key, 0), event[key])
+    return (
+        [stages[name] for name in stageOrder(stages) if name in stages],
+        converter.success,
+        action,
+    )
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def summarize(runs):
+    summary = {}
+    for run in runs:
+        for stage in run:
+            summary.setdefault(stage["stage"], []).append(stage)
+    result = {}
+    for name, stages in summary.items():
+        result[name] = {
+            "runs": len(stages),
+            "wall_min": min(s["wall"] for s in stages),
+            "wall_median": median([s["wall"] for s in stages]),
+        }
+        for key in ("cpu", "children_cpu", "count"):
+            if key in stages[0]:
+                result[name][key + "_median"] = median([s[key] for s in stages])
+        for key in ("peak_rss_kb", "children_peak_rss_kb"):
+            if key in stages[0]:
+                result[name][key] = max(s[key] for s in stages)
+    return result
+
+
+def stageOrder(summary):
+    return [name for name in STAGE_ORDER if name in summary] + sorted(
+        name for name in summary if name not in STAGE_ORDER
+    )
+
+
+def printSummary(summary, previous=None):
+    """
+    Print one line per stage. Nested stages (media_file, svg_optimize,
+    png_optimize) have no CPU columns; the wall time of media_file is
+    the sum over all files, which exceeds media's wall time with -j.
+    """
+    header = "%-20s %10s %10s %10s %10s %14s" % (
+        "stage",
+        "wall ms",
+        "min ms",
+        "cpu ms",
+        "child ms",
+        "peak rss MB",
+    )
+    if previous:
+        header += " %10s" % "vs before"
+    print(header)
+    for name in stageOrder(summary):
+        s = summary[name]
+        line = "%-20s %10.1f %10.1f" % (
+            name,
+            s["wall_median"] * 1000,
+            s["wall_min"] * 1000,
+        )
+        if "cpu_median" in s:
+            line += " %10.1f %10.1f %14.1f" % (
+                s["cpu_median"] * 1000,
+                s["children_cpu_median"] * 1000,
+                s["peak_rss_kb"] / 1024.0,
+            )
+        else:
+            line += " %10s %10s %14s" % ("", "", "")
+        if previous and name in previous and previous[name]["wall_median"]:
+            line += " %9.2fx" % (s["wall_median"] / previous[name]["wall_median"])
+        print(line)
+    print("peak rss: high-water mark of the process so far, cumulative over stages")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    grCorpus = parser.add_argument_group("corpus options")
+    grCorpus.add_argument(
+        "-n", "--paragraphs", type=int, default=500, help="number of paragraphs"
+    )
+    grCorpus.add_argument(
+        "-m", "--pngs", type=int, default=20, help="number of PNG images"
+    )
+    grCorpus.add_argument(
+        "-k", "--wmfs", type=int, default=10, help="number of vector WMF images"
+    )
+    grCorpus.add_argument(
+        "-b", "--bitmap-wmfs", type=int, default=0, help="number of bitmap WMF images"
+    )
+    grRun = parser.add_argument_group("run options")
+    grRun.add_argument(
+        "-r", "--repeat", type=int, default=5, help="conversions to measure"
+    )
+    grRun.add_argument(
+        "--real",
+        action="store_true",
+        default=False,
+        help="use the installed pandoc and java, not the stubs",
+    )
+    grRun.add_argument(
+        "--with-pandoc", default="pandoc", help="pandoc binary for --real"
+    )
+    grRun.add_argument(
+        "--with-wmf2svg",
+        default="/usr/local/java/wmf2svg.jar",
+        help="path to 'wmf2svg.jar' for --real",
+    )
+    grRun.add_argument(
+        "--stub-startup",
+        type=float,
+        default=0.0,
+        help="seconds each stub pandoc or java run sleeps, to simulate startup",
+    )
+    grRun.add_argument(
+        "-o", "--output", default=None, help="write the results to this JSON file"
+    )
+    grRun.add_argument(
+        "--compare", default=None, help="compare with the results in this JSON file"
+    )
+    grConv = parser.add_argument_group("docxtomd options")
+    grConv.add_argument(
+        "--html", action="store_true", default=False, help="also write HTML"
+    )
+    grConv.add_argument(
+        "-I",
+        "--recalc-imgdims",
+        action="store_true",
+        default=False,
+        help="recalculate image dims",
+    )
+    grConv.add_argument(
+        "-F",
+        "--inproc-filters",
+        action="store_true",
+        default=False,
+        help="in-process filters",
+    )
+    grConv.add_argument(
+        "-S", "--stream-ast", action="store_true", default=False, help="AST in memory"
+    )
+    grConv.add_argument(
+        "-W", "--persistent-wmf2svg", action="store_true", default=False, help="one JVM"
+    )
+    grConv.add_argument("-j", "--jobs", type=int, default=1, help="parallel media jobs")
+    grConv.add_argument("--cache-dir", default=None, help="media cache folder")
+    grConv.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="convert all runs into one folder, with the manifest",
+    )
+    grConv.add_argument(
+        "--change",
+        choices=("none", "touch", "media"),
+        default="touch",
+        help="with -i, what changes in the .docx before each run: nothing, "
+        "its mtime, or one image; default: touch",
+    )
+    grConv.add_argument(
+        "--dedupe",
+        action="store_true",
+        default=False,
+        help="write identical images once",
+    )
+    grConv.add_argument(
+        "--compress-svg",
+        choices=("fast", "default", "max"),
+        default=None,
+        help="optimize SVG images with this preset",
+    )
+    grConv.add_argument(
+        "--optimize-png",
+        choices=("fast", "default", "max"),
+        default=None,
+        help="recompress PNG images at this level",
+    )
+    args = parser.parse_args()
+
+    opts = {
+        "html": args.html,
+        "recalc_imgdims": args.recalc_imgdims,
+        "inproc_filters": args.inproc_filters,
+        "stream_ast": args.stream_ast,
+        "persistent_wmf2svg": args.persistent_wmf2svg,
+        "jobs": args.jobs,
+        "cache_dir": args.cache_dir,
+        "incremental": args.incremental,
+        "dedupe": args.dedupe,
+        "compress_svg": args.compress_svg,
+        "optimize_png": args.optimize_png,
+    }
+    # Filter scripts run by pandoc import mdutils
+    os.environ["PYTHONPATH"] = os.pathsep.join(
+        [ROOT] + [p for p in os.environ.get("PYTHONPATH", "").split(os.pathsep) if p]
+    )
+    if args.real:
+        opts["with_pandoc"] = args.with_pandoc
+        opts["with_wmf2svg"] = args.with_wmf2svg
+    else:
+        os.environ["PATH"] = STUBS + os.pathsep + os.environ.get("PATH", "")
+        os.environ["MDUTILS_STUB_STARTUP"] = str(args.stub_startup)
+        opts["with_pandoc"] = os.path.join(STUBS, "pandoc")
+        opts["with_wmf2svg"] = os.path.join(STUBS, "wmf2svg.jar")
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline-")
+    try:
+        docxpath = os.path.join(workdir, "bench.docx")
+        makeDocx(docxpath, args.paragraphs, args.pngs, args.wmfs, args.bitmap_wmfs)
+        runs = []
+        actions = []
+        setup = None
+        success = True
+        # With -i, run 0 writes the output and manifest, and is not measured
+        first = 0 if args.incremental else 1
+        for i in range(first, args.repeat + 1):
+            if args.incremental:
+                outdir = os.path.join(workdir, "out")
+                if i and args.change == "touch":
+                    mtime = os.path.getmtime(docxpath) + 1
+                    os.utime(docxpath, (mtime, mtime))
+                elif i and args.change == "media":
+                    changeMedia(docxpath, i)
+            else:
+                outdir = os.path.join(workdir, "out%d" % (i))
+            stages, ok, action = convert(docxpath, outdir, opts)
+            success = success and ok
+            if i:
+                runs.append(stages)
+                actions.append(action)
+            else:
+                setup = stages
+        images = sorted(os.listdir(os.path.join(outdir, "img")))
+        docxsize = os.path.getsize(docxpath)
+    finally:
+        shutil.rmtree(workdir)
+
+    results = {
+        "corpus": {
+            "paragraphs": args.paragraphs,
+            "pngs": args.pngs,
+            "wmfs": args.wmfs,
+            "bitmap_wmfs": args.bitmap_wmfs,
+            "docx_bytes": docxsize,
+        },
+        "options": opts,
+        "stubs": not args.real,
+        "success": success,
+        "actions": actions,
+        "setup": setup,
+        "images": len(images),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": runs,
+        "summary": summarize(runs),
+    }
+    previous = None
+    if args.compare:
+        with open(args.compare) as comparefile:
+            previous = json.load(comparefile)["summary"]
+    printSummary(results["summary"], previous)
+    if args.incremental:
+        print("actions: %s" % " ".join(actions))
+    if not success:
+        print("Conversion failed!")
+    if args.output:
+        with open(args.output, "w") as outputfile:
+            json.dump(results, outputfile, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""bench_splitmdatheadings
+  Time to split a large Markdown document at its headings
+
+Writes a synthetic document with the given number of lines: sections
+under # and ## headings, paragraphs that use reference links and
+footnotes, and all link definitions at the end, like a combined manual
+converted by docxtomd. Then splits it the way splitmdatheadings does,
+streaming from the file, and reports the time per phase.
+
+example:
+  $ python benchmarks/bench_splitmdatheadings.py -n 10000 100000 -l 2 -g 1 -j 8
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from mdutils import splitmdatheadings  # noqa: E402
+
+
+def makeDoc(path, count, links, seed=1):
+    """
+    Write a synthetic document of about count lines with links reference
+    link definitions, and return the number of headings.
+    """
+    rnd = random.Random(seed)
+    headings = 0
+    lines = 0
+    with io.open(path, "w", encoding="utf-8") as doc:
+        while lines < count - links:
+            if lines % 400 == 0:
+                doc.write(u"# Chapter %d\n" % (lines // 400 + 1))
+                headings += 1
+            elif lines % 50 == 0:
+                doc.write(u"## Section %d\n" % (lines // 50 + 1))
+                headings += 1
+            elif lines % 10 == 0:
+                doc.write(
+                    u"See [the reference][ref%d] and the note[^%d].\n"
+                    % (rnd.randrange(links), rnd.randrange(links))
+                )
+            else:
+                doc.write(u"Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n")
+            lines += 1
+        for i in range(links // 2):
+            doc.write(u"[ref%d]: https://example.com/doc/%d\n" % (i, i))
+            doc.write(u"[^%d]: Footnote %d.\n" % (i, i))
+    return headings
+
+
+def bench(count, links, levels, groups, jobs):
+    workdir = tempfile.mkdtemp(prefix="bench_splitmdatheadings-")
+    try:
+        docpath = os.path.join(workdir, "doc.md")
+        headings = makeDoc(docpath, count, links)
+        start = time.time()
+        linkdefs = {}
+        with io.open(docpath, encoding="utf-8") as docfile:
+            dirs = splitmdatheadings.scan_document(docfile, linkdefs, groups)
+        scanned = time.time()
+        with io.open(docpath, encoding="utf-8") as docfile:
+            splitmdatheadings.split_file(
+                os.path.join(workdir, "doc"),
+                splitmdatheadings.text_lines(docfile),
+                groups,
+                levels,
+                linkdefs,
+                jobs,
+                dirs,
+            )
+        done = time.time()
+        files = sum(
+            len(fns) for root, dirs, fns in os.walk(os.path.join(workdir, "doc"))
+        )
+    finally:
+        shutil.rmtree(workdir)
+    return {
+        "lines": count,
+        "headings": headings,
+        "links": len(linkdefs),
+        "files": files,
+        "jobs": jobs,
+        "scan_seconds": scanned - start,
+        "split_seconds": done - scanned,
+        "seconds": done - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "-n",
+        "--lines",
+        nargs="+",
+        type=int,
+        default=[10000, 100000],
+        help="document sizes in lines to measure",
+    )
+    parser.add_argument(
+        "-k", "--links", type=int, default=2000, help="number of link definitions"
+    )
+    parser.add_argument(
+        "-l", "--levels", type=int, default=2, help="split at heading levels 1..N"
+    )
+    parser.add_argument(
+        "-g", "--groups", type=int, default=0, help="group into folders at level N"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="sections to write in parallel"
+    )
+    parser.add_argument(
+        "--json", action="store_true", default=False, help="print JSON results"
+    )
+    args = parser.parse_args()
+    results = [
+        bench(count, args.links, args.levels, args.groups, args.jobs)
+        for count in args.lines
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(
+                "%(lines)8d lines  %(files)6d files  %(links)6d links  "
+                "scan %(scan_seconds)7.3f s  split %(split_seconds)7.3f s" % r
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""bench_startup
+  Startup time of the mdutils command line tools
+
+For each tool, measures the cumulative import time of its module with
+`python -X importtime`, lists heavy dependencies that were imported at
+startup although no command needs them yet, and times `--version` in a
+fresh interpreter. Exits with 1 if a tool is over the budget or
+imports a heavy dependency at startup, so it can guard a build.
+
+example:
+  $ python benchmarks/bench_startup.py --budget 100
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+MODULES = ["mdutils.docxtomd", "mdutils.wmftosvgpng", "mdutils.docxtomdbatch"]
+# Only needed for BMP media, --html, SVG compression or --jobs
+HEAVY = ["PIL", "markdown", "scour", "multiprocessing.pool", "pandocfilters"]
+IMPORTTIME_RE = re.compile(r"^import time:\s*(\d+) \|\s*(\d+) \|(\s*)(\S+)")
+
+
+def environ():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [ROOT] + [p for p in env.get("PYTHONPATH", "").split(os.pathsep) if p]
+    )
+    return env
+
+
+def importTime(module):
+    """
+    Returns:
+        tuple: (cumulative import time of module in ms, modules imported)
+    """
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        stderr=subprocess.PIPE,
+        env=environ(),
+        check=True,
+    ).stderr.decode("utf-8")
+    total = 0.0
+    imported = []
+    for line in out.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m:
+            imported.append(m.group(4))
+            if m.group(4) == module:
+                total = int(m.group(2)) / 1000.0
+    return total, imported
+
+
+def versionTime(module, repeat):
+    """
+    Returns:
+        float: best wall time of `python -m module --version` in ms
+    """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        subprocess.run(
+            [sys.executable, "-m", module, "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=environ(),
+            check=True,
+        )
+        elapsed = (time.time() - start) * 1000.0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def baseline(repeat):
+    """
+    Returns:
+        float: best wall time of a bare interpreter start in ms
+    """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        elapsed = (time.time() - start) * 1000.0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench(module, repeat):
+    importms, imported = importTime(module)
+    heavy = [dep for dep in HEAVY if dep in imported]
+    return {
+        "module": module,
+        "import_ms": importms,
+        "version_ms": versionTime(module, repeat),
+        "heavy_imports": heavy,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "-m", "--modules", nargs="+", default=MODULES, help="tool modules to measure"
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=10, help="repetitions, best is reported"
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=None,
+        help="max --version time in ms above a bare interpreter start",
+    )
+    parser.add_argument(
+        "--json", action="store_true", default=False, help="print JSON results"
+    )
+    args = parser.parse_args()
+    python = baseline(args.repeat)
+    results = [bench(module, args.repeat) for module in args.modules]
+    failed = False
+    for r in results:
+        r["overhead_ms"] = r["version_ms"] - python
+        r["over_budget"] = args.budget is not None and r["overhead_ms"] > args.budget
+        failed = failed or r["over_budget"] or bool(r["heavy_imports"])
+    if args.json:
+        print(json.dumps({"python_ms": python, "results": results}, indent=2))
+    else:
+        print("%-34s  %8.1f ms" % ("python -c pass", python))
+        for r in results:
+            print(
+                "%-34s  %8.1f ms  (+%.1f ms, import %.1f ms)%s%s"
+                % (
+                    r["module"] + " --version",
+                    r["version_ms"],
+                    r["overhead_ms"],
+                    r["import_ms"],
+                    "  OVER BUDGET" if r["over_budget"] else "",
+                    (
+                        "  heavy: " + ", ".join(r["heavy_imports"])
+                        if r["heavy_imports"]
+                        else ""
+                    ),
+                )
+            )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+/*
+ * Wmf2SvgBatch
+ *   Persistent wmf2svg worker for mdutils.wmftosvgpng
+ *   Copyright (c) 2016 by Adam Twardoch, licensed under Apache 2
+ *   https://github.com/twardoch/markdown-utils
+ *
+ * Converts many WMF files in one JVM. Reads requests on stdin and
+ * answers each on stdout:
+ *
+ *   FILES<TAB>length<TAB>length\n<input path><output path>  ->  OK\n
+ *   DATA<TAB>length\n<WMF bytes>  ->  OK<TAB>length\n<SVG bytes>
+ *
+ * or ERROR message\n if a conversion fails. Paths are UTF-8, preceded
+ * by their lengths in bytes, so they may hold any character. Runs with the Java 11+
+ * source launcher, no separate build step:
+ *
+ *   java -Djava.awt.headless=true -cp wmf2svg.jar Wmf2SvgBatch.java
+ */
+
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.EOFException;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+
+import javax.xml.transform.OutputKeys;
+import javax.xml.transform.Transformer;
+import javax.xml.transform.TransformerFactory;
+import javax.xml.transform.dom.DOMSource;
+import javax.xml.transform.stream.StreamResult;
+
+import net.arnx.wmf2svg.gdi.svg.SvgGdi;
+import net.arnx.wmf2svg.gdi.wmf.WmfParser;
+
+public class Wmf2SvgBatch {
+    public static void main(String[] args) throws Exception {
+        InputStream requests = new BufferedInputStream(System.in);
+        OutputStream replies = new BufferedOutputStream(new FileOutputStream(FileDescriptor.out));
+        // Keep library output away from the reply channel
+        System.setOut(System.err);
+
+        String line;
+        while ((line = readLine(requests)) != null) {
+            if (line.startsWith("DATA\t")) {
+                byte[] wmf = readFully(requests, Integer.parseInt(line.substring(5)));
+                try {
+                    ByteArrayOutputStream svg = new ByteArrayOutputStream();
+                    convert(new ByteArrayInputStream(wmf), svg);
+                    reply(replies, "OK\t" + svg.size());
+                    svg.writeTo(replies);
+                } catch (Throwable e) {
+                    reply(replies, error(e));
+                }
+            } else if (line.startsWith("FILES\t")) {
+                String[] lengths = line.split("\t");
+                String src = new String(readFully(requests, Integer.parseInt(lengths[1])), "UTF-8");
+                String dest = new String(readFully(requests, Integer.parseInt(lengths[2])), "UTF-8");
+                try {
+                    convertFile(src, dest);
+                    reply(replies, "OK");
+                } catch (Throwable e) {
+                    reply(replies, error(e));
+                }
+            } else {
+                reply(replies, "ERROR bad request");
+            }
+            replies.flush();
+        }
+    }
+
+    static String readLine(InputStream in) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int c;
+        while ((c = in.read()) != -1 && c != '\n') {
+            line.write(c);
+        }
+        if (c == -1 && line.size() == 0) {
+            return null;
+        }
+        return line.toString("UTF-8");
+    }
+
+    static byte[] readFully(InputStream in, int length) throws IOException {
+        byte[] data = new byte[length];
+        int offset = 0;
+        while (offset < length) {
+            int count = in.read(data, offset, length - offset);
+            if (count < 0) {
+                throw new EOFException();
+            }
+            offset += count;
+        }
+        return data;
+    }
+
+    static void reply(OutputStream out, String line) throws IOException {
+        out.write((line + "\n").getBytes("UTF-8"));
+    }
+
+    static String error(Throwable e) {
+        return "ERROR " + String.valueOf(e).replace('\n', ' ');
+    }
+
+    static void convertFile(String src, String dest) throws Exception {
+        InputStream in = new BufferedInputStream(new FileInputStream(src));
+        try {
+            OutputStream out = new BufferedOutputStream(new FileOutputStream(dest));
+            try {
+                convert(in, out);
+            } finally {
+                out.close();
+            }
+        } finally {
+            in.close();
+        }
+    }
+
+    static void convert(InputStream in, OutputStream out) throws Exception {
+        WmfParser parser = new WmfParser();
+        SvgGdi gdi = new SvgGdi(false);
+        parser.parse(in, gdi);
+        Transformer transformer = TransformerFactory.newInstance().newTransformer();
+        transformer.setOutputProperty(OutputKeys.METHOD, "xml");
+        transformer.setOutputProperty(OutputKeys.ENCODING, "UTF-8");
+        transformer.setOutputProperty(OutputKeys.DOCTYPE_PUBLIC, "-//W3C//DTD SVG 1.0//EN");
+        transformer.setOutputProperty(OutputKeys.DOCTYPE_SYSTEM,
+                "http://www.w3.org/TR/2001/REC-SVG-20010904/DTD/svg10.dtd");
+        transformer.transform(new DOMSource(gdi.getDocument()), new StreamResult(out));
+    }
+}
@@ -1,3 +1,18 @@
 """mdutils/__init__.py"""
 
-__all__ = ["docxtomd", "wmftosvgpng"]
+__all__ = [
+    "docxtomd",
+    "docxtomdbatch",
+    "docxtomdserver",
+    "manifest",
+    "mediacache",
+    "mediaoptimize",
+    "pandoc_addimgdims",
+    "pandoc_mapmedia",
+    "pandoc_pipeline",
+    "placefile",
+    "pngoptimize",
+    "splitmdatheadings",
+    "tracing",
+    "wmftosvgpng",
+]
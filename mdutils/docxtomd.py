@@ -10,6 +10,7 @@ or bitmap images contained in the .docx into either .svg or .png.
 
 example:
   $ ./docxtomd.py --html -d test/test1 test/test1.docx
+  $ docxtomd serve --workers 4   # conversion server, see docxtomdserver
 
 changes:
   2017-10-25: Fixes
@@ -19,11 +20,15 @@ todo:
   * Add support for EMF
 """
 
-__version__ = "0.4.5"
+__version__ = "0.4.6"
 
 import argparse
 import codecs
+import contextlib
 import fnmatch
+import functools
+import glob
+import hashlib
 import json
 import os
 import os.path
@@ -31,22 +36,62 @@ import shutil
 import string
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 import warnings
+import zipfile
 
-from mdutils import wmftosvgpng
+from mdutils import (
+    manifest,
+    mediacache,
+    mediaoptimize,
+    placefile,
+    pngoptimize,
+    tracing,
+    wmftosvgpng,
+)
 
-try:
-    import PIL.BmpImagePlugin
-except ImportError:
-    print("PIL or Pillow not found, run: pip install --user Pillow")
-    sys.exit(2)
+# PIL, markdown and multiprocessing are imported on first use, so that
+# runs which do not need them start fast
 
-try:
-    import markdown
 
-    MARKDOWN = True
-except ImportError:
-    MARKDOWN = False
+MARKDOWN_EXTENSIONS = (
+    "markdown.extensions.admonition",
+    "markdown.extensions.attr_list",
+    "markdown.extensions.def_list",
+    "markdown.extensions.footnotes",
+    "markdown.extensions.meta",
+    "markdown.extensions.smarty",
+    "markdown.extensions.tables",
+    "markdown.extensions.toc",
+    "pymdownx.betterem",
+    "pymdownx.headeranchor",
+    "pymdownx.magiclink",
+    "pymdownx.mark",
+    "pymdownx.superfences",
+    "mdx_sections",
+    "figcap",
+    "mdx_steroids.wikilink",
+)
+
+_renderers = threading.local()
+
+
+def getMarkdownRenderer():
+    """
+    Returns:
+        markdown.Markdown: with MARKDOWN_EXTENSIONS loaded, built once per
+        thread and reused for all documents converted in it; call reset()
+        after each document
+    """
+    renderer = getattr(_renderers, "markdown", None)
+    if renderer is None:
+        import markdown
+
+        renderer = markdown.Markdown(extensions=list(MARKDOWN_EXTENSIONS))
+        _renderers.markdown = renderer
+    return renderer
 
 
 def extractAlphanumeric(InputString):
@@ -76,12 +121,55 @@ class DocxToMdConverter:
         self.keepimgdims = opts.get("keep_imgdims", False)
         self.recalcimgdims = opts.get("recalc_imgdims", False)
         self.recalcmaxdims = opts.get("recalc_maxdims", 500)
+        self.inprocfilters = opts.get("inproc_filters", False)
+        self.persistentwmf2svg = opts.get("persistent_wmf2svg", False)
+        self.wmf2svgworker = opts.get("wmf2svg_worker", None)
+        self.jobs = opts.get("jobs", 1) or 1
+        self.mediacache = opts.get("media_cache", None)
+        if not self.mediacache and opts.get("cache_dir", None):
+            self.mediacache = mediacache.MediaCache(
+                opts["cache_dir"], (opts.get("cache_size", None) or 1024) * 2**20
+            )
+        self.tracer = opts.get("tracer", None)
+        if not self.tracer and opts.get("trace", None):
+            self.tracer = tracing.JsonLinesTracer(opts["trace"])
+        self.returncode = None
+        self.incremental = opts.get("incremental", False)
+        self.streamast = opts.get("stream_ast", False)
+        self.imgpool = opts.get("img_pool", False)
+        self.compresssvg = opts.get("compress_svg", None)
+        self.optimizepng = opts.get("optimize_png", None)
+        # Pool of processes for the optimization stages, shared with
+        # other conversions, e.g. by docxtomd serve; otherwise started
+        # by optimizePool() and closed in cleanup()
+        self.optimizepool = opts.get("optimize_pool", None)
+        self.ownoptimizepool = False
+        self.dedupe = opts.get("dedupe", False) or self.imgpool
+        self.mediahashes = {}
+        self.duplicates = {}
+        self.ast = None
+        self.skipped = False
+        self.manifest = None
+        self.manifestentry = None
+        self.fingerprint = None
+        self.imgmap = None
         self.success = True
         self.stdout = None
         self.stderr = None
         self.mediafolder = self.imgfolder
         self.cwd = os.path.dirname(os.path.realpath(os.getcwd()))
+        self.workdir = None
+        self.filterenv = {}
         self.mediainfopath = None
+        self.mediainfo = None
+        self.mediamap = {}
+        # WMF file name -> how it was converted, see wmftosvgpng.toSvgOrPng()
+        self.mediastatus = {}
+        self.placements = None
+        # Media converted by convertMediaOnly() that the full conversion
+        # can use after all, and the names of the files it came from
+        self.preparedmedia = None
+        self.preparedsources = None
 
     def preparePaths(self):
         if not self.inputpath:
@@ -118,24 +206,30 @@ class DocxToMdConverter:
         )
         if not self.jsonpath:
             self.jsonpath = os.path.join(self.outfolder, self.mediaprefix + ".doc.json")
+        if self.success:
+            # Private working folder of this conversion, on the same
+            # filesystem as the output, so that concurrent conversions
+            # never share pandoc's extracted media folder
+            self.workdir = tempfile.mkdtemp(prefix=".docxtomd-", dir=self.outfolder)
 
-    def pandocRun(self, args):
+    def pandocRun(self, args, input=None):
         # To get access to pandoc-citeproc when we use a included copy of pandoc,
         # we need to add the pypandoc/files dir to the PATH
         new_env = os.environ.copy()
         files_path = os.path.join(self.cwd, "files")
         new_env["PATH"] = new_env.get("PATH", "") + os.pathsep + files_path
+        new_env.update(self.filterenv)
 
         if self.debug:
             print("Running: " + " ".join(args))
         p = subprocess.Popen(
             args,
             bufsize=4096,
-            stdin=None,
+            stdin=None if input is None else subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             env=new_env,
-            cwd=self.cwd,
+            cwd=self.workdir,
         )
         if p.returncode is not None:
             raise RuntimeError(
@@ -144,66 +238,373 @@ class DocxToMdConverter:
                 )
             )
         try:
-            self.stdout, self.stderr = p.communicate(None)
-            self.success = True
+            self.stdout, self.stderr = p.communicate(input)
+            self.returncode = p.returncode
+            self.success = p.returncode == 0
         except OSError:
             self.success = False
             raise RuntimeError(
                 'Pandoc died with exitcode "%s" during conversion.' % (p.returncode)
             )
+        if not self.success:
+            warnings.warn(
+                'Pandoc failed with exitcode "%s": %s'
+                % (
+                    p.returncode,
+                    (self.stderr or b"").decode("utf-8", "replace").strip(),
+                )
+            )
         # assert self.stdout == ""
 
+    def convertBmp(self, bmpfn):
+        try:
+            import PIL
+            import PIL.BmpImagePlugin
+        except ImportError:
+            warnings.warn("PIL or Pillow not found, run: pip install --user Pillow")
+            return None
+        fullsrc = os.path.join(self.mediafolder, bmpfn)
+        fullout = os.path.splitext(fullsrc)[0] + ".png"
+        pngfn = os.path.splitext(bmpfn)[0] + ".png"
+        cachekey = None
+        if self.mediacache:
+            with open(fullsrc, "rb") as bmpfile:
+                cachekey = self.mediacache.key(
+                    bmpfile.read(), converter="bmptopng", pillow=PIL.__version__
+                )
+            if self.mediacache.fetch(cachekey, os.path.splitext(fullsrc)[0])[0]:
+                return pngfn
+        PIL.BmpImagePlugin.DibImageFile(fullsrc).save(fullout)
+        if cachekey:
+            self.mediacache.store(cachekey, fullout)
+        return pngfn
+
+    def convertWmf(self, wmffn, worker=None):
+        fullsrc = os.path.join(self.mediafolder, wmffn)
+        fulloutbase = os.path.splitext(fullsrc)[0]
+        status = self.mediastatus[wmffn] = {}
+        rettype, retpath = wmftosvgpng.toSvgOrPng(
+            **{
+                "inputpath": fullsrc,
+                "outputbase": fulloutbase,
+                "compress": False,
+                "verbose": False,
+                "remove": not self.debug,
+                "with_wmf2svg": self.wmf2svg,
+                "worker": worker,
+                "cache": self.mediacache,
+                "status": status,
+            }
+        )
+        if rettype:
+            return os.path.basename(retpath)
+        return None
+
+    def runMediaJobs(self, jobs):
+        """
+        Run independent media conversions, in a thread pool if --jobs > 1.
+
+        Args:
+            jobs (list): (function, argument) pairs
+
+        Returns:
+            list: results in the same order as jobs
+        """
+
+        def run(job):
+            if not self.tracer:
+                return job[0](job[1])
+            srcpath = os.path.join(self.mediafolder, job[1])
+            with self.stage("media_file", file=job[1]) as event:
+                event["bytes_in"] = os.path.getsize(srcpath)
+                result = job[0](job[1])
+                event.update(self.mediastatus.get(job[1], {}))
+                event["output"] = result
+                event["success"] = bool(result)
+                if result:
+                    event["bytes_out"] = os.path.getsize(
+                        os.path.join(self.mediafolder, result)
+                    )
+            return result
+
+        if self.jobs > 1 and len(jobs) > 1:
+            from multiprocessing.pool import ThreadPool
+
+            pool = ThreadPool(min(self.jobs, len(jobs)))
+            try:
+                return pool.map(run, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        return [run(job) for job in jobs]
+
+    def findDuplicateMedia(self, filenames):
+        """
+        Hash the media files and group identical ones.
+
+        Args:
+            filenames (list): media file names in the media folder
+
+        Returns:
+            list: filenames without the duplicates; of identical files,
+            the one with the lowest image number is kept
+        """
+        self.mediahashes = {}
+        self.duplicates = {}
+        kept = {}
+        for fn in sorted(filenames, key=lambda fn: (len(fn), fn)):
+            digest = hashlib.sha1()
+            with open(os.path.join(self.mediafolder, fn), "rb") as mediafile:
+                for chunk in iter(lambda: mediafile.read(2**20), b""):
+                    digest.update(chunk)
+            self.mediahashes[fn] = digest.hexdigest()
+            if self.mediahashes[fn] in kept:
+                self.duplicates[fn] = kept[self.mediahashes[fn]]
+            else:
+                kept[self.mediahashes[fn]] = fn
+        return [fn for fn in filenames if fn not in self.duplicates]
+
     def prepareMedia(self):
+        if self.mediafolder:
+            self.convertMedia()
+            self.writeMediaInfo()
+
+    def convertMedia(self):
+        """
+        Convert, deduplicate and optimize the files in the media folder,
+        and map each source file name to its result in self.mediamap.
+        """
         self.mediamap = {}
+        self.mediastatus = {}
         if self.mediafolder:
-            for bmpfn in fnmatch.filter(os.listdir(self.mediafolder), "*.bmp"):
-                fullsrc = os.path.join(self.mediafolder, bmpfn)
-                fullout = os.path.splitext(fullsrc)[0] + ".png"
-                pngfn = os.path.splitext(bmpfn)[0] + ".png"
-                PIL.BmpImagePlugin.DibImageFile(fullsrc).save(fullout)
-                self.mediamap[bmpfn] = pngfn
-
-            for pngfn in fnmatch.filter(os.listdir(self.mediafolder), "*.png"):
+            filenames = sorted(os.listdir(self.mediafolder))
+            if self.dedupe:
+                filenames = self.findDuplicateMedia(filenames)
+            bmpfns = fnmatch.filter(filenames, "*.bmp")
+            pngfns = fnmatch.filter(filenames, "*.png")
+            wmffns = fnmatch.filter(filenames, "*.wmf")
+            worker = self.wmf2svgworker
+            if not worker and self.persistentwmf2svg and wmffns:
+                worker = wmftosvgpng.Wmf2SvgWorker(self.wmf2svg, size=self.jobs)
+            try:
+                results = self.runMediaJobs(
+                    [(self.convertBmp, bmpfn) for bmpfn in bmpfns]
+                    + [
+                        (functools.partial(self.convertWmf, worker=worker), wmffn)
+                        for wmffn in wmffns
+                    ]
+                )
+            finally:
+                if worker and worker is not self.wmf2svgworker:
+                    worker.close()
+
+            # Merge in a fixed order, independent of completion order
+            for bmpfn, pngfn in zip(bmpfns, results[: len(bmpfns)]):
+                if pngfn:
+                    self.mediamap[bmpfn] = pngfn
+                    pngfns.append(pngfn)
+
+            for pngfn in pngfns:
                 self.mediamap[pngfn] = pngfn
 
-            for wmffn in fnmatch.filter(os.listdir(self.mediafolder), "*.wmf"):
-                fullsrc = os.path.join(self.mediafolder, wmffn)
-                fulloutbase = os.path.splitext(fullsrc)[0]
-                rettype, retpath = wmftosvgpng.toSvgOrPng(
-                    **{
-                        "inputpath": fullsrc,
-                        "outputbase": fulloutbase,
-                        "compress": False,
-                        "verbose": False,
-                        "remove": not self.debug,
-                        "wmf2svg": self.wmf2svg,
-                    }
-                )
-                if rettype:
-                    retfn = os.path.basename(retpath)
+            for wmffn, retfn in zip(wmffns, results[len(bmpfns) :]):
+                if retfn:
                     self.mediamap[wmffn] = retfn
+
+            # Duplicates point at the conversion of the file they repeat
+            for dupfn, fn in sorted(self.duplicates.items()):
+                self.mediamap[dupfn] = self.mediamap.get(fn, fn)
+
+            if self.compresssvg:
+                self.optimizeMedia(
+                    ".svg",
+                    "svg_optimize",
+                    wmftosvgpng.optimizeSvgFiles,
+                    self.compresssvg,
+                )
+            if self.optimizepng:
+                self.optimizeMedia(
+                    ".png",
+                    "png_optimize",
+                    pngoptimize.optimizePngFiles,
+                    self.optimizepng,
+                )
+
+    def writeMediaInfo(self):
+        """
+        Write the .media.json that tells the filters where the converted
+        media goes, and point the filters at it.
+        """
+        if self.mediafolder:
             self.mediainfopath = os.path.join(
                 self.outfolder, self.mediaprefix + ".media.json"
             )
+            self.mediainfo = {
+                "srcfull": self.mediafolder,
+                "dstfull": self.imgfolder,
+                "prefix": self.mediaprefix,
+                "srcsubstr": "./media/",
+                "dstsubstr": os.path.relpath(self.imgfolder, self.outfolder).replace(
+                    os.sep, "/"
+                )
+                + "/",
+                "map": self.mediamap,
+            }
+            if self.workdir:
+                # pandoc_mapmedia reports the images it placed here
+                self.mediainfo["placedpath"] = os.path.join(self.workdir, "placed.json")
+            if self.dedupe:
+                self.mediainfo["dedupe"] = True
+                self.mediainfo["imgpool"] = self.imgpool
+                # Converted file name -> hash of its source
+                self.mediainfo["hashes"] = dict(
+                    (self.mediamap.get(fn, fn), digest)
+                    for fn, digest in self.mediahashes.items()
+                    if fn not in self.duplicates
+                )
             mediainfofile = open(self.mediainfopath, "w")
-            json.dump(
-                {
-                    "srcfull": self.mediafolder,
-                    "dstfull": self.imgfolder,
-                    "prefix": self.mediaprefix,
-                    "srcsubstr": "./media/",
-                    "dstsubstr": "img/",
-                    "map": self.mediamap,
-                },
-                mediainfofile,
-            )
+            json.dump(self.mediainfo, mediainfofile)
             mediainfofile.close()
-            os.environ["pandoc_filter_mapmedia"] = self.mediainfopath
-            os.environ["pandoc_filter_keepimgdims"] = "1" if self.keepimgdims else "0"
-            os.environ["pandoc_filter_recalcimgdims"] = (
-                "1" if self.recalcimgdims else "0"
+            self.filterenv = {
+                "pandoc_filter_mapmedia": self.mediainfopath,
+                "pandoc_filter_keepimgdims": "1" if self.keepimgdims else "0",
+                "pandoc_filter_recalcimgdims": "1" if self.recalcimgdims else "0",
+                "pandoc_filter_recalcmaxdims": str(self.recalcmaxdims),
+            }
+
+    def mediaFields(self):
+        """
+        Returns:
+            dict: fields of the media event: images, types by output
+            extension, duplicates, and how the WMF files were converted,
+            with the exit codes of java runs
+        """
+        fields = {"images": len(self.mediamap), "types": {}}
+        if self.dedupe:
+            fields["duplicates"] = len(self.duplicates)
+        for fn in self.mediamap.values():
+            ext = os.path.splitext(fn)[1].lower()[1:]
+            fields["types"][ext] = fields["types"].get(ext, 0) + 1
+        if self.mediastatus:
+            fields["converters"] = {}
+            fields["exitcodes"] = {}
+            for status in self.mediastatus.values():
+                converter = status.get("converter", "none")
+                fields["converters"][converter] = (
+                    fields["converters"].get(converter, 0) + 1
+                )
+                if "exitcode" in status:
+                    # JSON object keys are strings
+                    code = str(status["exitcode"])
+                    fields["exitcodes"][code] = fields["exitcodes"].get(code, 0) + 1
+        return fields
+
+    def optimizePool(self):
+        """
+        Returns:
+            multiprocessing.pool.Pool: the shared pool, or one pool of
+            --jobs processes used by all optimization stages of this
+            conversion, or None to optimize one by one, also inside the
+            daemonic worker processes of docxtomdbatch, which already
+            convert documents in parallel and cannot start a pool
+        """
+        if self.optimizepool is None and self.jobs > 1:
+            import multiprocessing
+
+            if not multiprocessing.current_process().daemon:
+                self.optimizepool = mediaoptimize.spawnContext().Pool(self.jobs)
+                self.ownoptimizepool = True
+        return self.optimizepool
+
+    def optimizeMedia(self, ext, name, optimizeFiles, setting):
+        """
+        Optimize all media files of a type in place, in the pool of
+        optimizePool().
+
+        Args:
+            ext (str): file extension, e.g. '.svg'
+            name (str): stage name for the tracer
+            optimizeFiles (function): wmftosvgpng.optimizeSvgFiles or
+                pngoptimize.optimizePngFiles
+            setting (str): preset or level passed to optimizeFiles
+        """
+        fns = [
+            fn
+            for fn in sorted(os.listdir(self.mediafolder))
+            if fn.lower().endswith(ext) and fn not in self.duplicates
+        ]
+        if not fns:
+            return
+        with self.stage(name, setting=setting) as event:
+            pool = self.optimizePool()
+            if pool is None:
+                event["pool"] = "serial"
+            else:
+                event["pool"] = "conversion" if self.ownoptimizepool else "shared"
+            results = optimizeFiles(
+                [os.path.join(self.mediafolder, fn) for fn in fns],
+                setting,
+                cache=self.mediacache,
+                pool=pool,
             )
-            os.environ["pandoc_filter_recalcmaxdims"] = str(self.recalcmaxdims)
+            event["bytes_in"] = sum(result["bytes_in"] for result in results)
+            event["bytes_out"] = sum(result["bytes_out"] for result in results)
+            event["files"] = [
+                {
+                    "file": fn,
+                    "bytes_in": result["bytes_in"],
+                    "bytes_out": result["bytes_out"],
+                    "seconds": result["seconds"],
+                    "cached": result["cached"],
+                }
+                for fn, result in zip(fns, results)
+            ]
+
+    def applyFiltersInProcess(self):
+        """
+        Load the AST once (from memory with --stream-ast, otherwise from
+        .doc.json), run the mapmedia and addimgdims filters over it in
+        a single walk, and return the serialized result for pandoc's stdin.
+        """
+        from mdutils import pandoc_addimgdims, pandoc_mapmedia, pandoc_pipeline
+
+        context = pandoc_pipeline.FilterContext(
+            mediainfopath=self.mediainfopath,
+            mediainfo=self.mediainfo,
+            keepimgdims=self.keepimgdims,
+            recalcimgdims=self.recalcimgdims,
+            recalcmaxdims=self.recalcmaxdims,
+        )
+        if self.ast is not None:
+            doc = json.loads(self.ast.decode("utf-8"))
+            self.ast = None
+        else:
+            with open(self.jsonpath) as jsonfile:
+                doc = json.load(jsonfile)
+        doc = pandoc_pipeline.applyFilters(
+            doc,
+            [
+                functools.partial(pandoc_mapmedia.pandoc_wmftosvgpng, context=context),
+                functools.partial(pandoc_addimgdims.pandoc_addimgdims, context=context),
+            ],
+            "markdown_github",
+        )
+        self.imgmap = dict(context.placed)
+        self.placements = dict(context.placements)
+        return json.dumps(doc).encode("utf-8")
+
+    def readPlaced(self):
+        """
+        Read the images that pandoc_mapmedia placed when pandoc ran it
+        as a --filter, see pandoc_pipeline.FilterContext.writePlaced().
+        """
+        placedpath = (self.mediainfo or {}).get("placedpath")
+        if not placedpath or not os.path.exists(placedpath):
+            return
+        with open(placedpath) as placedfile:
+            placed = json.load(placedfile)
+        self.imgmap = placed["placed"]
+        self.placements = placed["placements"]
 
     def convertJsonToMd(self):
         pdArgs = ["--section-divs", "--atx-headers"]
@@ -249,19 +650,24 @@ class DocxToMdConverter:
         args = [self.pandoc]
         args.append("--from=" + "json")
         args.append("--to=" + pdMdOutFmt)
-        args.append(self.jsonpath)
+        if not self.inprocfilters and self.ast is None:
+            args.append(self.jsonpath)
         args.append("--output=" + self.outputpath)
         args.extend(pdArgs)
-        if pdFilters:
-            f = ["--filter=" + x for x in pdFilters]
-            args.extend(f)
-
-        self.pandocRun(args)
+        if self.inprocfilters:
+            self.pandocRun(args, input=self.applyFiltersInProcess())
+        else:
+            if pdFilters:
+                f = ["--filter=" + x for x in pdFilters]
+                args.extend(f)
+            self.pandocRun(args, input=self.ast)
+            self.ast = None
+            if self.success:
+                self.readPlaced()
 
         if self.debug:
             print("STDERR: %s" % self.stderr)
             print("STDOUT: %s" % self.stdout)
-        self.success = True
 
     def convertDocxToJson(self):
         pdArgs = ["--section-divs", "--atx-headers"]
@@ -276,52 +682,48 @@ class DocxToMdConverter:
         args.append("--from=" + self.format)
         args.append("--to=" + pdMdOutFmt)
         args.append(self.inputpath)
-        args.append("--output=" + self.jsonpath)
+        if not self.streamast:
+            args.append("--output=" + self.jsonpath)
         args.extend(pdArgs)
         if pdFilters:
             f = ["--filter=" + x for x in pdFilters]
             args.extend(f)
 
         self.pandocRun(args)
+        if not self.success:
+            # No AST to filter, and nothing in self.jsonpath
+            self.stdout = None
+            return
+
+        if self.streamast:
+            # Keep the AST in memory for the second pass
+            self.ast, self.stdout = self.stdout, None
+            if self.debug:
+                with open(self.jsonpath, "wb") as jsonfile:
+                    jsonfile.write(self.ast)
 
         if self.format == "docx":
-            self.mediafolder = os.path.join(self.outfolder, "media")
-            if os.path.exists(self.mediafolder):
-                shutil.rmtree(self.mediafolder)
-            if os.path.exists(os.path.join(self.cwd, "media")):
-                shutil.move(os.path.join(self.cwd, "media"), self.outfolder)
-            else:
-                os.makedirs(os.path.join(self.outfolder, "media"))
-            self.mediafolder = os.path.join(self.outfolder, "media")
-        self.success = True
+            # pandoc extracts into its working folder, which is private
+            self.mediafolder = os.path.join(self.workdir, "media")
+            if not os.path.exists(self.mediafolder):
+                os.makedirs(self.mediafolder)
 
     def convertMdToHtml(self):
-        if not MARKDOWN:
+        try:
+            import markdown  # noqa: F401
+        except ImportError:
             warnings.warn("Install: pip install --user markdown")
         else:
             try:
-                mdexts = [
-                    "markdown.extensions.admonition",
-                    "markdown.extensions.attr_list",
-                    "markdown.extensions.def_list",
-                    "markdown.extensions.footnotes",
-                    "markdown.extensions.meta",
-                    "markdown.extensions.smarty",
-                    "markdown.extensions.tables",
-                    "markdown.extensions.tables",
-                    "markdown.extensions.toc",
-                    "pymdownx.betterem",
-                    "pymdownx.headeranchor",
-                    "pymdownx.magiclink",
-                    "pymdownx.mark",
-                    "pymdownx.superfences",
-                    "mdx_sections",
-                    "figcap",
-                    "mdx_steroids.wikilink",
-                ]
                 mdfile = codecs.open(self.outputpath, mode="r", encoding="utf-8")
                 md = mdfile.read()
-                html = markdown.markdown(md, extensions=mdexts)
+                mdfile.close()
+                renderer = getMarkdownRenderer()
+                try:
+                    html = renderer.convert(md)
+                finally:
+                    # Drop the per-document state (footnotes, TOC, meta)
+                    renderer.reset()
                 htmlfile = codecs.open(
                     os.path.splitext(self.outputpath)[0] + ".html",
                     "w",
@@ -334,22 +736,167 @@ class DocxToMdConverter:
             except:
                 self.success = False
 
-    def convertDocxToMd(self):
-        # For various reasons, we run pandoc twice:
-        # Once docx-to-json, then json-to-md
-        self.preparePaths()
-        if self.success:
-            self.convertDocxToJson()
-        if self.success:
-            self.prepareMedia()
-        if self.success:
-            self.convertJsonToMd()
-        if self.success and self.html:
-            self.convertMdToHtml()
+    def manifestOptions(self):
+        """
+        Returns:
+            dict: the options that change the produced files
+        """
+        return {
+            "format": self.format,
+            "toc": self.toc,
+            "keepimgdims": self.keepimgdims,
+            "recalcimgdims": self.recalcimgdims,
+            "recalcmaxdims": self.recalcmaxdims,
+            "html": self.html,
+            "imgfolder": self.imgfolder,
+            "dedupe": self.dedupe,
+            "imgpool": self.imgpool,
+            "compresssvg": self.compresssvg,
+            "optimizepng": self.optimizepng,
+        }
+
+    def checkManifest(self):
+        """
+        Compare the input and options with the manifest of the output folder.
+
+        Returns:
+            str: 'skip' if the outputs are up to date, 'media' if only the
+            embedded images changed, otherwise 'full'
+        """
+        self.manifest = manifest.Manifest(self.outfolder)
+        name = os.path.basename(self.outputpath)
+        entry = self.manifestentry = self.manifest.get(name)
+        if (
+            not entry
+            or entry.get("input") != self.inputpath
+            or entry.get("converter") != __version__
+            or entry.get("pandoc") != manifest.pandocVersion(self.pandoc)
+            or entry.get("options") != self.manifestOptions()
+            or not manifest.outputsPresent(self.outfolder, entry.get("outputs", {}))
+        ):
+            return "full"
+        old = entry["fingerprint"]
+        stat = os.stat(self.inputpath)
+        if stat.st_size == old["size"] and stat.st_mtime == old["mtime"]:
+            return "skip"
+        self.fingerprint = manifest.inputFingerprint(self.inputpath)
+        if self.fingerprint["texthash"] != old["texthash"]:
+            return "full"
+        if self.fingerprint["mediahash"] == old["mediahash"]:
+            # Touched but unchanged
+            entry["fingerprint"] = self.fingerprint
+            self.manifest.update(name, entry)
+            return "skip"
+        # Recalculated image dimensions are written into the Markdown, and
+        # so is which images share one file with --dedupe and --img-pool,
+        # which a changed image can split or join
+        if (
+            entry.get("imgmap")
+            and self.format == "docx"
+            and not self.recalcimgdims
+            and not self.dedupe
+        ):
+            return "media"
+        return "full"
+
+    def updateManifest(self):
+        if not self.fingerprint:
+            self.fingerprint = manifest.inputFingerprint(self.inputpath)
+        paths = [self.outputpath]
+        if self.html:
+            paths.append(os.path.splitext(self.outputpath)[0] + ".html")
+        if self.imgmap is not None:
+            paths.extend(os.path.join(self.imgfolder, fn) for fn in self.imgmap)
+        else:
+            paths.extend(
+                glob.glob(os.path.join(self.imgfolder, self.mediaprefix + "_*"))
+            )
+        self.manifest.update(
+            os.path.basename(self.outputpath),
+            {
+                "input": self.inputpath,
+                "fingerprint": self.fingerprint,
+                "converter": __version__,
+                "pandoc": manifest.pandocVersion(self.pandoc),
+                "options": self.manifestOptions(),
+                "outputs": manifest.outputSizes(self.outfolder, paths),
+                "imgmap": self.imgmap,
+            },
+        )
+
+    def convertMediaOnly(self, imgmap):
+        """
+        Redo only the media stage: extract the media straight from the
+        .docx, convert it, and replace the image files recorded in the
+        manifest. The Markdown and HTML are left as they are.
+
+        Returns:
+            bool: False if the images cannot be replaced in place, e.g.
+            because a WMF now converts to a different type
+        """
+        self.mediafolder = os.path.join(self.workdir, "media")
+        os.makedirs(self.mediafolder)
+        with zipfile.ZipFile(self.inputpath) as archive:
+            for info in archive.infolist():
+                if info.filename.startswith(manifest.MEDIA_PREFIX):
+                    fn = os.path.basename(info.filename)
+                    if fn:
+                        with archive.open(info) as src:
+                            with open(os.path.join(self.mediafolder, fn), "wb") as dst:
+                                shutil.copyfileobj(src, dst)
+        sources = sorted(os.listdir(self.mediafolder))
+        self.convertMedia()
+        if not self.success:
+            shutil.rmtree(self.mediafolder)
+            return False
+        places = []
+        for dstfn, srcfn in sorted(imgmap.items()):
+            mapfn = self.mediamap.get(srcfn, srcfn)
+            srcpath = os.path.join(self.mediafolder, mapfn)
+            if os.path.splitext(mapfn)[1] != os.path.splitext(dstfn)[1] or (
+                not os.path.exists(srcpath)
+            ):
+                # Keep the converted media out of the way of pandoc's
+                # extraction, for reusePreparedMedia()
+                self.preparedmedia = self.mediafolder + ".prepared"
+                self.preparedsources = sources
+                os.rename(self.mediafolder, self.preparedmedia)
+                return False
+            places.append((srcpath, os.path.join(self.imgfolder, dstfn)))
+        for srcpath, dstpath in places:
+            placefile.placeFile(srcpath, dstpath)
+        self.imgmap = imgmap
+        return True
+
+    def reusePreparedMedia(self):
+        """
+        Replace the media that pandoc extracted from the same .docx with
+        the media that convertMediaOnly() already converted, if pandoc
+        extracted the same files.
+
+        Returns:
+            bool: False if the media still needs prepareMedia()
+        """
+        preparedmedia, self.preparedmedia = self.preparedmedia, None
+        if sorted(os.listdir(self.mediafolder)) != self.preparedsources:
+            shutil.rmtree(preparedmedia)
+            return False
+        shutil.rmtree(self.mediafolder)
+        os.rename(preparedmedia, self.mediafolder)
+        self.writeMediaInfo()
+        return True
+
+    def cleanup(self):
+        if self.ownoptimizepool:
+            self.optimizepool.close()
+            self.optimizepool.join()
+            self.optimizepool = None
+            self.ownoptimizepool = False
         if not self.debug:
             if self.jsonpath:
                 try:
-                    os.remove(self.jsonpath)
+                    if os.path.exists(self.jsonpath):
+                        os.remove(self.jsonpath)
                 except:
                     warnings.warn("Cannot clean up %s" % (self.jsonpath))
             if self.mediainfopath:
@@ -357,11 +904,121 @@ class DocxToMdConverter:
                     os.remove(self.mediainfopath)
                 except:
                     warnings.warn("Cannot clean up %s" % (self.mediainfopath))
-            if self.mediafolder:
+            if self.workdir:
                 try:
-                    shutil.rmtree(self.mediafolder)
+                    shutil.rmtree(self.workdir)
                 except:
-                    warnings.warn("Cannot clean up %s" % (self.mediafolder))
+                    warnings.warn("Cannot clean up %s" % (self.workdir))
+        elif self.workdir:
+            print("Kept intermediate files in %s" % (self.workdir))
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        """
+        Time a stage of the conversion and report it to the tracer,
+        see mdutils.tracing.
+
+        Args:
+            name (str): stage name
+            **fields: initial event fields
+
+        Yields:
+            dict: the event, to which the stage can add fields
+        """
+        event = dict(fields)
+        if not self.tracer:
+            yield event
+            return
+        event.update({"event": name, "document": self.inputpath, "pid": os.getpid()})
+        event["time"] = start = time.time()
+        try:
+            yield event
+        except Exception as e:
+            event["error"] = "%s: %s" % (type(e).__name__, e)
+            event["success"] = False
+            raise
+        finally:
+            event["seconds"] = time.time() - start
+            event.setdefault("success", self.success)
+            tracing.emit(self.tracer, event)
+
+    def pandocFields(self, outputpath=None):
+        """
+        Returns:
+            dict: exit code, output and stderr sizes of the last pandoc run
+        """
+        fields = {
+            "exitcode": self.returncode,
+            "stderr_bytes": len(self.stderr or b""),
+        }
+        if self.ast is not None:
+            fields["bytes_out"] = len(self.ast)
+        elif outputpath and os.path.exists(outputpath):
+            fields["bytes_out"] = os.path.getsize(outputpath)
+        return fields
+
+    def convertStages(self):
+        """
+        Returns:
+            str: what was done, 'skip', 'media' or 'full'
+        """
+        with self.stage("paths") as event:
+            self.preparePaths()
+            event["outputpath"] = self.outputpath
+        action = "full"
+        if self.success and self.incremental:
+            with self.stage("manifest") as event:
+                action = event["action"] = self.checkManifest()
+        if action == "media":
+            with self.stage("media") as event:
+                if not self.convertMediaOnly(self.manifestentry["imgmap"]):
+                    self.success = True
+                    action = "full"
+                event.update(self.mediaFields())
+        if action == "skip":
+            self.skipped = True
+        elif action == "full":
+            # For various reasons, we run pandoc twice:
+            # Once docx-to-json, then json-to-md
+            if self.success:
+                with self.stage("pandoc_docx_to_json") as event:
+                    event["bytes_in"] = os.path.getsize(self.inputpath)
+                    self.convertDocxToJson()
+                    event.update(self.pandocFields(self.jsonpath))
+            if self.success:
+                with self.stage("media") as event:
+                    if self.preparedmedia and self.reusePreparedMedia():
+                        event["reused"] = True
+                    else:
+                        self.prepareMedia()
+                    event.update(self.mediaFields())
+            if self.success:
+                with self.stage("pandoc_json_to_md") as event:
+                    event["filters"] = "inproc" if self.inprocfilters else "pandoc"
+                    self.convertJsonToMd()
+                    event.update(self.pandocFields(self.outputpath))
+                    if self.imgmap is not None:
+                        event["images"] = len(self.imgmap)
+                    if self.placements is not None:
+                        event["placements"] = self.placements
+            if self.success and self.html:
+                with self.stage("html") as event:
+                    self.convertMdToHtml()
+                    htmlpath = os.path.splitext(self.outputpath)[0] + ".html"
+                    if os.path.exists(htmlpath):
+                        event["bytes_out"] = os.path.getsize(htmlpath)
+        if self.success and self.incremental and action != "skip":
+            self.updateManifest()
+        return action
+
+    def convertDocxToMd(self):
+        with self.stage("document") as event:
+            try:
+                event["action"] = self.convertStages()
+            finally:
+                self.cleanup()
+            event["skipped"] = self.skipped
+            event["outputpath"] = self.outputpath
 
 
 def parseOptions():
@@ -390,6 +1047,16 @@ def parseOptions():
         default=None,
         help="output folder, default to current",
     )
+    addConversionOptions(parser)
+    args = parser.parse_args()
+    return vars(args)
+
+
+def addConversionOptions(parser):
+    """
+    Add the conversion and other options shared by docxtomd and
+    docxtomdbatch to an argparse parser.
+    """
     grProc = parser.add_argument_group("conversion options")
     grProc.add_argument(
         "-t", "--toc", action="store_true", default=False, help="generate TOC"
@@ -416,6 +1083,77 @@ def parseOptions():
         default=500,
         help="max image width in px, otherwise 100%%, default: 500",
     )
+    grProc.add_argument(
+        "-F",
+        "--inproc-filters",
+        action="store_true",
+        default=False,
+        help="run image filters in-process in one pass, not as pandoc --filter",
+    )
+    grProc.add_argument(
+        "-W",
+        "--persistent-wmf2svg",
+        action="store_true",
+        default=False,
+        help="convert all WMF files in one wmf2svg process (needs Java 11+)",
+    )
+    grProc.add_argument(
+        "-j",
+        "--jobs",
+        action="store",
+        type=int,
+        default=1,
+        help="number of media files to convert in parallel, default: 1",
+    )
+    grProc.add_argument(
+        "--cache-dir",
+        action="store",
+        default=None,
+        help="cache converted WMF/BMP media in this folder",
+    )
+    grProc.add_argument(
+        "--cache-size",
+        action="store",
+        type=int,
+        default=1024,
+        help="max size of the media cache in MB, default: 1024",
+    )
+    grProc.add_argument(
+        "-S",
+        "--stream-ast",
+        action="store_true",
+        default=False,
+        help="pass the AST between pandoc runs in memory, not via .doc.json",
+    )
+    grProc.add_argument(
+        "--compress-svg",
+        action="store",
+        choices=sorted(wmftosvgpng.SVG_PRESETS),
+        default=None,
+        help="optimize SVG images with scour, preset from fastest to smallest: "
+        "fast, default, max (lowers precision)",
+    )
+    grProc.add_argument(
+        "--optimize-png",
+        action="store",
+        choices=sorted(pngoptimize.PNG_LEVELS),
+        default=None,
+        help="recompress PNG images losslessly, trying more settings from "
+        "fast to max",
+    )
+    grProc.add_argument(
+        "--dedupe",
+        action="store_true",
+        default=False,
+        help="convert and write identical images once, shared by all references",
+    )
+    grProc.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        default=False,
+        help="skip documents unchanged since the last run, redo only changed media",
+    )
     grOutput = parser.add_argument_group("additional conversion options")
     grOutput.add_argument(
         "-H",
@@ -438,6 +1176,12 @@ def parseOptions():
     grOther.add_argument(
         "-v", "--verbose", action="store_true", help="increase output verbosity"
     )
+    grOther.add_argument(
+        "--trace",
+        action="store",
+        default=None,
+        help="append timing events of each stage to this file as JSON lines",
+    )
     grOther.add_argument(
         "--with-pandoc", default="/usr/local/bin/pandoc", help="path to 'pandoc' binary"
     )
@@ -446,11 +1190,15 @@ def parseOptions():
         default="/usr/local/java/wmf2svg.jar",
         help="path to 'wmf2svg.jar' binary",
     )
-    args = parser.parse_args()
-    return vars(args)
+    return parser
 
 
 def main():
+    if sys.argv[1:2] == ["serve"]:
+        from mdutils import docxtomdserver
+
+        docxtomdserver.main(sys.argv[2:])
+        return
     opts = parseOptions()
     if opts["debug"]:
         print("Running with options: %s" % opts)
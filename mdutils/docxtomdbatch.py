@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+"""docxtomdbatch
+  Batch Word .docx to Markdown converter
+  Copyright (c) 2016 by Adam Twardoch, licensed under Apache 2
+  https://github.com/twardoch/markdown-utils
+
+This tool converts many documents with docxtomd in one run. Inputs can
+be files, folders (searched recursively) or glob patterns. Documents
+are converted concurrently in a pool of worker processes that import
+everything once, so each further document costs only its conversion.
+Each document is written to its own folder, OUT_DIR/name/name.md,
+where OUT_DIR defaults to the folder of each input. With --img-pool,
+the images of all documents go into one shared folder, each distinct
+image once. Each worker optimizes the images of its document one by
+one, since the documents already run in parallel.
+
+example:
+  $ docxtomdbatch --html -P 8 -d out docs/ 'manuals/*.docx'
+"""
+
+__version__ = "0.4.5"
+
+import argparse
+import fnmatch
+import glob
+import json
+import multiprocessing
+import os
+import os.path
+import sys
+import time
+import traceback
+import warnings
+
+from mdutils import docxtomd, wmftosvgpng
+
+# Per-process state of the worker processes, set up by initWorker()
+_opts = {}
+_wmf2svgworker = None
+
+
+def findInputs(inputs, pattern):
+    """
+    Args:
+        inputs (list): files, folders or glob patterns
+        pattern (str): filename pattern used inside folders, e.g. '*.docx'
+
+    Returns:
+        list: unique real paths of the input files, in the given order
+    """
+    found = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths = []
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for fn in sorted(fnmatch.filter(files, pattern)):
+                    # Skip Word lock files
+                    if not fn.startswith("~$"):
+                        paths.append(os.path.join(root, fn))
+        elif os.path.exists(item):
+            paths = [item]
+        else:
+            paths = sorted(glob.glob(item))
+            if not paths:
+                warnings.warn("No input found for %s" % (item))
+        for path in paths:
+            path = os.path.realpath(path)
+            if os.path.isfile(path) and path not in found:
+                found.append(path)
+    return found
+
+
+def makeJobs(inputpaths, outdir):
+    """
+    Args:
+        inputpaths (list): input file paths
+        outdir (str): root output folder or None
+
+    Returns:
+        list: (inputpath, out_dir) pairs, one output folder per document
+    """
+    jobs = []
+    used = set()
+    for inputpath in inputpaths:
+        name = os.path.splitext(os.path.basename(inputpath))[0]
+        root = outdir if outdir else os.path.dirname(inputpath)
+        folder = os.path.realpath(os.path.join(root, name))
+        index = 1
+        while folder in used:
+            index += 1
+            folder = os.path.realpath(os.path.join(root, "%s-%d" % (name, index)))
+        used.add(folder)
+        jobs.append((inputpath, folder))
+    return jobs
+
+
+def initWorker(opts):
+    global _opts, _wmf2svgworker
+    _opts = opts
+    if opts.get("persistent_wmf2svg"):
+        # The JVM exits by itself when this process ends and closes its stdin
+        _wmf2svgworker = wmftosvgpng.Wmf2SvgWorker(
+            opts.get("with_wmf2svg"), size=opts.get("jobs", 1) or 1
+        )
+
+
+def convertDocument(job):
+    """
+    Convert one document. Runs in a worker process; any error is caught
+    and reported so that one bad document does not stop the batch.
+
+    Args:
+        job (tuple): (inputpath, out_dir)
+
+    Returns:
+        dict: inputpath, outputpath, success, skipped, error, seconds
+    """
+    inputpath, outdir = job
+    start = time.time()
+    result = {
+        "inputpath": inputpath,
+        "outputpath": None,
+        "success": False,
+        "skipped": False,
+        "error": None,
+    }
+    try:
+        opts = dict(_opts)
+        opts.update(
+            {
+                "inputpath": inputpath,
+                "outputpath": None,
+                "out_dir": outdir,
+                "wmf2svg_worker": _wmf2svgworker,
+            }
+        )
+        converter = docxtomd.DocxToMdConverter(**opts)
+        converter.convertDocxToMd()
+        result["outputpath"] = converter.outputpath
+        result["success"] = converter.success
+        result["skipped"] = converter.skipped
+        if not converter.success:
+            result["error"] = "Nothing converted"
+    except Exception as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+        if _opts.get("debug"):
+            traceback.print_exc()
+    result["seconds"] = time.time() - start
+    return result
+
+
+def convertBatch(jobs, opts, processes=None):
+    """
+    Args:
+        jobs (list): (inputpath, out_dir) pairs from makeJobs()
+        opts (dict): docxtomd options shared by all documents
+        processes (int): number of worker processes, default: CPU count
+
+    Yields:
+        dict: one result per document, in completion order
+    """
+    if not processes:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(jobs))
+    if processes <= 1:
+        initWorker(opts)
+        for job in jobs:
+            yield convertDocument(job)
+        return
+    pool = multiprocessing.Pool(processes, initializer=initWorker, initargs=(opts,))
+    try:
+        for result in pool.imap_unordered(convertDocument, jobs):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def summarize(results, seconds):
+    converted = [r for r in results if r["success"]]
+    failed = [r for r in results if not r["success"]]
+    return {
+        "documents": len(results),
+        "converted": len(converted),
+        "failed": len(failed),
+        "skipped": len([r for r in converted if r["skipped"]]),
+        "seconds": seconds,
+        "document_seconds": sum(r["seconds"] for r in results),
+        "failures": [r["inputpath"] for r in failed],
+        "results": results,
+    }
+
+
+def parseOptions():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    grInput = parser.add_argument_group("input and output options")
+    grInput.add_argument(
+        "inputs", nargs="+", help="input files, folders or glob patterns"
+    )
+    grInput.add_argument(
+        "-f",
+        "--format",
+        action="store",
+        default="docx",
+        help="input format, default 'docx'",
+    )
+    grInput.add_argument(
+        "-p",
+        "--pattern",
+        action="store",
+        default=None,
+        help="filename pattern in input folders, default '*.FORMAT'",
+    )
+    grInput.add_argument(
+        "-d",
+        "--out-dir",
+        action="store",
+        default=None,
+        help="root output folder, default to the folder of each input",
+    )
+    grBatch = parser.add_argument_group("batch options")
+    grBatch.add_argument(
+        "-P",
+        "--processes",
+        action="store",
+        type=int,
+        default=None,
+        help="number of documents to convert in parallel, default: CPU count",
+    )
+    grBatch.add_argument(
+        "--img-pool",
+        action="store",
+        default=None,
+        help="write the images of all documents once, named by content, "
+        "into this shared folder",
+    )
+    grBatch.add_argument(
+        "--json",
+        action="store_true",
+        default=False,
+        help="print the summary as JSON",
+    )
+    docxtomd.addConversionOptions(parser)
+    args = parser.parse_args()
+    return vars(args)
+
+
+def main():
+    opts = parseOptions()
+    inputs = opts.pop("inputs")
+    pattern = opts.pop("pattern") or "*." + opts["format"]
+    processes = opts.pop("processes")
+    asjson = opts.pop("json")
+    outdir = opts.pop("out_dir")
+    if outdir:
+        outdir = os.path.realpath(outdir)
+    imgpool = opts.pop("img_pool")
+    if imgpool:
+        opts["img_dir"] = os.path.realpath(imgpool)
+        opts["img_pool"] = True
+
+    jobs = makeJobs(findInputs(inputs, pattern), outdir)
+    if not jobs:
+        print("No input documents found.")
+        sys.exit(2)
+
+    start = time.time()
+    results = []
+    for result in convertBatch(jobs, opts, processes):
+        results.append(result)
+        if not asjson:
+            if result["success"]:
+                print(
+                    "%s  %7.2fs  %s -> %s"
+                    % (
+                        "SKIP" if result["skipped"] else "OK  ",
+                        result["seconds"],
+                        result["inputpath"],
+                        result["outputpath"],
+                    )
+                )
+            else:
+                print(
+                    "FAIL  %7.2fs  %s: %s"
+                    % (result["seconds"], result["inputpath"], result["error"])
+                )
+    summary = summarize(results, time.time() - start)
+    if asjson:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(
+            "Converted %d of %d documents in %.2fs "
+            "(%d unchanged, %d failed, %.2fs per document)"
+            % (
+                summary["converted"],
+                summary["documents"],
+                summary["seconds"],
+                summary["skipped"],
+                summary["failed"],
+                summary["document_seconds"] / summary["documents"],
+            )
+        )
+    if summary["failed"]:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
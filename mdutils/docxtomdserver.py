@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+"""docxtomd serve
+  Word .docx to Markdown conversion server
+  Copyright (c) 2016 by Adam Twardoch, licensed under Apache 2
+  https://github.com/twardoch/markdown-utils
+
+Runs docxtomd as a long-lived service, so that each conversion does not
+pay for a fresh Python process: the image filters run in-process, one
+pool of wmf2svg JVMs, the media cache, one pool of processes for SVG
+and PNG optimization and the Markdown renderers stay loaded between
+documents. Conversions run on a fixed number of worker
+threads; further requests wait in a bounded queue, and are refused
+with 503 when it is full.
+
+The server listens on localhost or on a Unix socket. Input and output
+paths in requests are paths on the server's filesystem.
+
+API:
+  POST /convert  {"inputpath": "/in/doc.docx", "out_dir": "/out/doc",
+                  "html": true}
+                 -> 200 {"success": true, "outputpath": ..., "seconds": ...}
+                 -> 500 {"success": false, "error": ...} if it failed
+                 -> 503 if the queue is full
+  GET /status    -> 200 {"workers": ..., "active": ..., "queued": ...}
+
+example:
+  $ docxtomd serve -W --cache-dir ~/.cache/mdutils --workers 4
+  $ curl -d '{"inputpath": "/data/in.docx"}' http://127.0.0.1:8765/convert
+"""
+
+__version__ = "0.4.5"
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+import warnings
+
+from mdutils import docxtomd, mediacache, mediaoptimize, tracing, wmftosvgpng
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    import SocketServer as socketserver
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+DEFAULT_PORT = 8765
+# Conversion options that a request may set; the others are fixed when
+# the server starts
+REQUEST_OPTIONS = (
+    "inputpath",
+    "outputpath",
+    "out_dir",
+    "img_dir",
+    "format",
+    "toc",
+    "keep_imgdims",
+    "recalc_imgdims",
+    "recalc_maxdims",
+    "html",
+    "incremental",
+)
+
+
+def ignoreSignals():
+    """
+    Let the processes of the optimization pool outlive Ctrl+C or a
+    SIGTERM sent to the whole process group, so that the server can
+    still close the pool cleanly; they exit when it is closed.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+class ConversionService:
+    """
+    Converts documents on a fixed number of worker threads that share
+    the warm state. Each worker thread keeps its own Markdown renderer.
+    """
+
+    def __init__(self, opts, workers=2, queuesize=16):
+        """
+        Args:
+            opts (dict): docxtomd options used for every conversion
+            workers (int): number of documents converted at once
+            queuesize (int): max number of requests waiting for a worker
+        """
+        self.opts = dict(opts)
+        self.workers = max(1, workers)
+        self.jobs = queue.Queue(maxsize=max(0, queuesize) or 1)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.counts = {"converted": 0, "failed": 0, "rejected": 0}
+        self.started = time.time()
+        self.threads = []
+        self.wmf2svgworker = None
+        if self.opts.get("persistent_wmf2svg"):
+            self.wmf2svgworker = wmftosvgpng.Wmf2SvgWorker(
+                self.opts.get("with_wmf2svg", wmftosvgpng.WMF2SVG),
+                size=self.workers * (self.opts.get("jobs") or 1),
+            )
+        self.mediacache = None
+        if self.opts.get("cache_dir"):
+            self.mediacache = mediacache.MediaCache(
+                self.opts["cache_dir"],
+                (self.opts.get("cache_size") or 1024) * 2**20,
+            )
+        self.optimizepool = None
+        if self.opts.get("compress_svg") or self.opts.get("optimize_png"):
+            # Started before the worker threads; spawned, not forked
+            self.optimizepool = mediaoptimize.spawnContext().Pool(
+                self.workers * (self.opts.get("jobs") or 1),
+                initializer=ignoreSignals,
+            )
+        self.tracer = None
+        if self.opts.get("trace"):
+            self.tracer = tracing.JsonLinesTracer(self.opts["trace"])
+        self.loadFilters()
+
+    def loadFilters(self):
+        """
+        Import the pandoc filters once, to run them in-process.
+        """
+        try:
+            from mdutils import pandoc_addimgdims, pandoc_mapmedia  # noqa: F401
+        except ImportError:
+            warnings.warn("pandocfilters not found, running filters through pandoc")
+            return
+        self.opts["inproc_filters"] = True
+        self.opts["stream_ast"] = True
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name="docxtomd-%d" % (i + 1))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, request):
+        """
+        Queue a conversion and wait for its result.
+
+        Args:
+            request (dict): options from REQUEST_OPTIONS, 'inputpath' required
+
+        Returns:
+            dict: inputpath, outputpath, success, skipped, error, seconds,
+            or None if the queue is full
+        """
+        job = {"request": request, "done": threading.Event(), "result": None}
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            with self.lock:
+                self.counts["rejected"] += 1
+            return None
+        job["done"].wait()
+        return job["result"]
+
+    def work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            with self.lock:
+                self.active += 1
+            try:
+                job["result"] = self.convert(job["request"])
+            finally:
+                with self.lock:
+                    self.active -= 1
+                    if job["result"] and job["result"]["success"]:
+                        self.counts["converted"] += 1
+                    else:
+                        self.counts["failed"] += 1
+                job["done"].set()
+
+    def convert(self, request):
+        start = time.time()
+        result = {
+            "inputpath": request.get("inputpath"),
+            "outputpath": None,
+            "success": False,
+            "skipped": False,
+            "error": None,
+        }
+        try:
+            opts = dict(self.opts)
+            opts.update(
+                dict((key, request[key]) for key in REQUEST_OPTIONS if key in request)
+            )
+            opts.update(
+                {
+                    "wmf2svg_worker": self.wmf2svgworker,
+                    "media_cache": self.mediacache,
+                    "optimize_pool": self.optimizepool,
+                    "tracer": self.tracer,
+                }
+            )
+            converter = docxtomd.DocxToMdConverter(**opts)
+            converter.convertDocxToMd()
+            result["outputpath"] = converter.outputpath
+            result["success"] = converter.success
+            result["skipped"] = converter.skipped
+            if not converter.success:
+                result["error"] = "Nothing converted"
+        except Exception as e:
+            result["error"] = "%s: %s" % (type(e).__name__, e)
+            if self.opts.get("debug"):
+                traceback.print_exc()
+        result["seconds"] = time.time() - start
+        return result
+
+    def status(self):
+        with self.lock:
+            status = dict(self.counts)
+            status["active"] = self.active
+        status.update(
+            {
+                "version": __version__,
+                "workers": self.workers,
+                "queued": self.jobs.qsize(),
+                "queue_size": self.jobs.maxsize,
+                "uptime": time.time() - self.started,
+            }
+        )
+        return status
+
+    def close(self):
+        for thread in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.wmf2svgworker:
+            self.wmf2svgworker.close()
+        if self.optimizepool:
+            self.optimizepool.close()
+            self.optimizepool.join()
+            self.optimizepool = None
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "docxtomd/" + __version__
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/status":
+            self.reply(200, self.server.service.status())
+        else:
+            self.reply(404, {"error": "Not found: %s" % (self.path)})
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/convert":
+            self.reply(404, {"error": "Not found: %s" % (self.path)})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            if not isinstance(request, dict) or not request.get("inputpath"):
+                raise ValueError("inputpath is required")
+        except ValueError as e:
+            self.reply(400, {"error": "Bad request: %s" % (e)})
+            return
+        result = self.server.service.submit(request)
+        if result is None:
+            self.reply(503, {"error": "Queue is full"}, {"Retry-After": "1"})
+        else:
+            self.reply(200 if result["success"] else 500, result)
+
+    def reply(self, code, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket peers have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+
+def makeServer(
+    service, host="127.0.0.1", port=DEFAULT_PORT, socketpath=None, verbose=False
+):
+    """
+    Returns:
+        socketserver.BaseServer: serving the HTTP API of the service,
+        on the Unix socket socketpath if given, else on host:port
+    """
+    if socketpath:
+        if os.path.exists(socketpath):
+            os.remove(socketpath)
+        server = ThreadingUnixHTTPServer(socketpath, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def parseOptions(args=None):
+    parser = argparse.ArgumentParser(
+        prog="docxtomd serve",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    grServer = parser.add_argument_group("server options")
+    grServer.add_argument(
+        "--host", default="127.0.0.1", help="address to listen on, default: 127.0.0.1"
+    )
+    grServer.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help="port to listen on, default: %d" % (DEFAULT_PORT),
+    )
+    grServer.add_argument(
+        "--socket",
+        default=None,
+        help="listen on this Unix socket instead of host:port",
+    )
+    grServer.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="number of documents to convert at once, default: 2",
+    )
+    grServer.add_argument(
+        "--queue",
+        type=int,
+        default=16,
+        help="max number of waiting requests, default: 16",
+    )
+    docxtomd.addConversionOptions(parser)
+    return vars(parser.parse_args(args))
+
+
+def main(args=None):
+    opts = parseOptions(args)
+    host = opts.pop("host")
+    port = opts.pop("port")
+    socketpath = opts.pop("socket")
+    workers = opts.pop("workers")
+    queuesize = opts.pop("queue")
+
+    service = ConversionService(opts, workers=workers, queuesize=queuesize)
+    server = makeServer(service, host, port, socketpath, opts.get("verbose"))
+    # Stop cleanly on SIGTERM, as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    service.start()
+    sys.stderr.write(
+        "docxtomd serving on %s\n"
+        % (socketpath if socketpath else "http://%s:%d" % (host, port))
+    )
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socketpath and os.path.exists(socketpath):
+            os.remove(socketpath)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""manifest
+  Conversion manifest for incremental docxtomd runs
+  Copyright (c) 2016 by Adam Twardoch, licensed under Apache 2
+  https://github.com/twardoch/markdown-utils
+
+Records, per output folder, what each converted document was made
+from: a fingerprint of the input, the converter and pandoc versions,
+the options and the files produced. docxtomd --incremental uses it to
+skip unchanged documents and to redo only the media of documents whose
+images changed but whose text did not.
+"""
+
+__version__ = "0.4.5"
+
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import zipfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MANIFEST_NAME = ".docxtomd-manifest.json"
+MEDIA_PREFIX = "word/media/"
+
+_pandocversions = {}
+
+
+def umask():
+    # Read once, on import, since reading it means setting it
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+UMASK = umask()
+
+
+def pandocVersion(pandoc):
+    """
+    Returns:
+        str: first line of `pandoc --version`, memoized per binary
+    """
+    if pandoc not in _pandocversions:
+        try:
+            out = subprocess.check_output([pandoc, "--version"])
+            _pandocversions[pandoc] = out.decode("utf-8").splitlines()[0]
+        except (OSError, subprocess.CalledProcessError, IndexError):
+            _pandocversions[pandoc] = None
+    return _pandocversions[pandoc]
+
+
+def inputFingerprint(path):
+    """
+    For .docx and other zip-based inputs, the text and the embedded media
+    are hashed separately from the zip directory (names, CRCs and sizes),
+    without decompressing anything.
+
+    Returns:
+        dict: size, mtime, texthash and mediahash of the input file
+    """
+    stat = os.stat(path)
+    texthash = hashlib.sha1()
+    mediahash = hashlib.sha1()
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in sorted(archive.infolist(), key=lambda i: i.filename):
+                item = "%s:%08x:%d\n" % (info.filename, info.CRC, info.file_size)
+                if info.filename.startswith(MEDIA_PREFIX):
+                    mediahash.update(item.encode("utf-8"))
+                else:
+                    texthash.update(item.encode("utf-8"))
+    else:
+        with open(path, "rb") as inputfile:
+            for chunk in iter(lambda: inputfile.read(2**20), b""):
+                texthash.update(chunk)
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "texthash": texthash.hexdigest(),
+        "mediahash": mediahash.hexdigest(),
+    }
+
+
+def outputsPresent(folder, outputs):
+    """
+    Args:
+        folder (str): output folder
+        outputs (dict): relative path -> size, as recorded
+
+    Returns:
+        bool: True if all outputs still exist with the recorded sizes
+    """
+    for relpath, size in outputs.items():
+        try:
+            if os.path.getsize(os.path.join(folder, relpath)) != size:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def outputSizes(folder, paths):
+    """
+    Returns:
+        dict: path relative to folder -> size, for the given paths
+    """
+    outputs = {}
+    for path in paths:
+        if os.path.exists(path):
+            outputs[os.path.relpath(path, folder)] = os.path.getsize(path)
+    return outputs
+
+
+class Manifest:
+    def __init__(self, folder):
+        """
+        Args:
+            folder (str): output folder the manifest describes
+        """
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+
+    def load(self):
+        try:
+            with open(self.path) as manifestfile:
+                return json.load(manifestfile)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get(self, name):
+        """
+        Returns:
+            dict: the entry for the output file name, or None
+        """
+        return self.load().get(name)
+
+    def update(self, name, entry):
+        """
+        Set the entry for the output file name. Safe against concurrent
+        conversions writing into the same folder: they take turns by
+        locking the folder itself, so no lock file is left behind.
+        """
+        lockfd = None
+        if fcntl:
+            lockfd = os.open(self.folder, os.O_RDONLY)
+        try:
+            if lockfd is not None:
+                fcntl.flock(lockfd, fcntl.LOCK_EX)
+            entries = self.load()
+            if entry is None:
+                entries.pop(name, None)
+            else:
+                entries[name] = entry
+            fd, tmppath = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as tmpfile:
+                    json.dump(entries, tmpfile, indent=1, sort_keys=True)
+                # mkstemp creates the file readable by the owner only
+                os.chmod(tmppath, 0o666 & ~UMASK)
+                os.rename(tmppath, self.path)
+            except (IOError, OSError):
+                if os.path.exists(tmppath):
+                    os.remove(tmppath)
+                raise
+        finally:
+            if lockfd is not None:
+                os.close(lockfd)
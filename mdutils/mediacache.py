@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+"""mediacache
+  Content-addressed cache for converted media
+  Copyright (c) 2016 by Adam Twardoch, licensed under Apache 2
+  https://github.com/twardoch/markdown-utils
+
+Stores the results of media conversions (WMF to SVG or PNG, BMP to PNG)
+on disk, keyed by a hash of the source bytes and the conversion options.
+The same logo or diagram embedded in many documents is then converted
+only once. The cache is bounded in size; the least recently used
+entries are removed first. It can be shared by concurrent processes.
+Each process adds what it stores to an estimate of the total size kept
+in the cache folder, so that the folder is only walked for eviction
+once the estimate exceeds the limit, not on every run.
+
+Usage in Python:
+  from mdutils import mediacache
+  cache = mediacache.MediaCache('~/.cache/mdutils', maxsize=1024 * 2 ** 20)
+  key = cache.key(data, compress=False)
+  rettype, retpath = cache.fetch(key, 'out/image1')
+  if not rettype:
+      ...convert data to 'out/image1.svg'...
+      cache.store(key, 'out/image1.svg')
+"""
+
+__version__ = "0.4.5"
+
+import glob
+import hashlib
+import json
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from mdutils.placefile import placeFile
+
+DEFAULT_MAXSIZE = 1024 * 2**20
+# Estimated total size of the cache in bytes, shared by all processes
+SIZE_NAME = ".size"
+# Eviction removes entries until the cache fits this share of maxsize,
+# so that it runs again only after more entries have been stored
+EVICT_TARGET = 0.9
+
+
+def toolVersion(path):
+    """
+    Args:
+        path (str): path to an external tool, e.g. 'wmf2svg.jar'
+
+    Returns:
+        str: identifies the installed build of the tool for cache keys
+    """
+    try:
+        stat = os.stat(os.path.realpath(path))
+    except OSError:
+        return path
+    return "%s:%d:%d" % (
+        os.path.basename(os.path.realpath(path)),
+        stat.st_size,
+        stat.st_mtime,
+    )
+
+
+class MediaCache:
+    def __init__(self, path, maxsize=DEFAULT_MAXSIZE):
+        """
+        Args:
+            path (str): cache folder, created if needed
+            maxsize (int): max total size of cached files in bytes
+        """
+        self.path = os.path.realpath(os.path.expanduser(path))
+        self.maxsize = maxsize
+        if not os.path.exists(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                # Created by a concurrent process
+                pass
+
+    def key(self, data, **options):
+        """
+        Args:
+            data (bytes): source media bytes
+            **options: conversion options that affect the result
+
+        Returns:
+            str: hex digest identifying the conversion result
+        """
+        digest = hashlib.sha1(data)
+        digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def entryBase(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def fetch(self, key, outputbase):
+        """
+        Copy a cached result to outputbase + its extension, as a
+        copy-on-write clone where the filesystem supports it.
+
+        Returns:
+            tuple: (extension, path) or (None, None) on a cache miss
+        """
+        for cachedpath in glob.glob(self.entryBase(key) + ".*"):
+            ext = os.path.splitext(cachedpath)[1]
+            if ext == ".tmp":
+                continue
+            outputpath = os.path.realpath(outputbase + ext)
+            try:
+                # Mark as recently used
+                os.utime(cachedpath, None)
+                # Never hardlinked: the cache must not share files with outputs
+                placeFile(cachedpath, outputpath, link=False)
+            except (IOError, OSError):
+                # Evicted in the meantime
+                continue
+            return (ext, outputpath)
+        return (None, None)
+
+    def store(self, key, path):
+        """
+        Add a conversion result; the extension of path is kept as its type.
+        """
+        base = self.entryBase(key)
+        folder = os.path.dirname(base)
+        try:
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+        except OSError:
+            pass
+        try:
+            fd, tmppath = tempfile.mkstemp(dir=folder, suffix=".tmp")
+            os.close(fd)
+            placeFile(path, tmppath, link=False)
+            size = os.path.getsize(tmppath)
+            # Atomic, so concurrent readers never see a partial file
+            os.rename(tmppath, base + os.path.splitext(path)[1])
+        except (IOError, OSError):
+            return
+        total = self.updateSize(size)
+        if total is None or total > self.maxsize:
+            self.evict()
+
+    def updateSize(self, size=0, total=None):
+        """
+        Add size to the estimated total size of the cache, or set it to
+        total. Concurrent processes take turns by locking SIZE_NAME.
+
+        Returns:
+            int: the new estimate, or None if there was none yet
+        """
+        try:
+            fd = os.open(
+                os.path.join(self.path, SIZE_NAME), os.O_RDWR | os.O_CREAT, 0o666
+            )
+        except OSError:
+            return None
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            if total is None:
+                try:
+                    total = int(os.read(fd, 32)) + size
+                except ValueError:
+                    # New or unreadable, evict() writes it
+                    return None
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, str(total).encode("ascii"))
+            return total
+        except OSError:
+            return None
+        finally:
+            os.close(fd)
+
+    def evict(self):
+        """
+        If the cache exceeds maxsize, remove least recently used entries
+        until it fits EVICT_TARGET of maxsize. Stores the total size found
+        as the new estimate.
+        """
+        entries = []
+        total = 0
+        for root, dirs, files in os.walk(self.path):
+            for fn in files:
+                if fn == SIZE_NAME:
+                    continue
+                path = os.path.join(root, fn)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total > self.maxsize:
+            entries.sort()
+            for mtime, size, path in entries:
+                if total <= self.maxsize * EVICT_TARGET:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+        self.updateSize(total=total)
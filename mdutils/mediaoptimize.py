@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""mediaoptimize
+  Optimize media files in place, with a cache, in a pool of processes
+  Copyright (c) 2016 by Adam Twardoch, licensed under Apache 2
+  https://github.com/twardoch/markdown-utils
+
+Shared by the SVG optimization of wmftosvgpng and the PNG optimization
+of pngoptimize, which only pass their optimize function and the fields
+that identify its results in the cache.
+
+Usage in Python:
+  from mdutils import mediacache, mediaoptimize, pngoptimize
+  for result in mediaoptimize.optimizeFiles(
+          pngoptimize.optimizePng, paths, 'max', processes=4,
+          cache=mediacache.MediaCache('~/.cache/mdutils'),
+          converter='pngoptimize', level='max'):
+      print(result['path'], result['bytes_in'], result['bytes_out'])
+"""
+
+__version__ = "0.4.6"
+
+import os
+import time
+
+
+def spawnContext():
+    """
+    Returns:
+        multiprocessing context that starts processes with spawn, or
+        the multiprocessing module on Python 2, which only forks
+    """
+    import multiprocessing
+
+    if hasattr(multiprocessing, "get_context"):
+        return multiprocessing.get_context("spawn")
+    return multiprocessing
+
+
+def optimizeFile(path, optimize, setting, cache=None, cachefields=None):
+    """
+    Optimize a file in place. The file is only rewritten if the result
+    is smaller.
+
+    Args:
+        path (str): media file
+        optimize (function): optimize(data, setting), returns bytes
+        setting (str): e.g. a preset or level name
+        cache (mediacache.MediaCache): optional cache of optimized files
+        cachefields (dict): options for cache.key() that identify the
+            result besides the file contents
+
+    Returns:
+        dict: path, bytes_in, bytes_out, seconds, cached
+    """
+    start = time.time()
+    with open(path, "rb") as mediafile:
+        data = mediafile.read()
+    result = {"path": path, "bytes_in": len(data), "cached": False}
+    cachekey = None
+    if cache:
+        cachekey = cache.key(data, **(cachefields or {}))
+        if cache.fetch(cachekey, os.path.splitext(path)[0])[0]:
+            result["cached"] = True
+    if not result["cached"]:
+        optimized = optimize(data, setting)
+        if len(optimized) < len(data):
+            with open(path, "wb") as mediafile:
+                mediafile.write(optimized)
+        if cachekey:
+            cache.store(cachekey, path)
+    result["bytes_out"] = os.path.getsize(path)
+    result["seconds"] = time.time() - start
+    return result
+
+
+def _optimizeFileJob(job):
+    return optimizeFile(*job)
+
+
+def optimizeFiles(
+    optimize, paths, setting, processes=1, cache=None, pool=None, cachefields=None
+):
+    """
+    Optimize many files in place, in a pool of processes. Without a
+    pool, one is started for these files, with spawn rather than fork
+    since the caller may be running threads. Inside a daemonic process,
+    e.g. a worker of docxtomdbatch, which cannot start a pool, the files
+    are optimized one by one.
+
+    Args:
+        optimize (function): optimize(data, setting), defined at module
+            level so that it can be sent to the pool
+        paths (list): media files
+        setting (str): passed to optimize
+        processes (int): max number of processes
+        cache (mediacache.MediaCache): optional cache of optimized files
+        pool (multiprocessing.pool.Pool): optional pool to run in, e.g.
+            one shared by many documents; processes is then ignored
+        cachefields (dict): see optimizeFile()
+
+    Returns:
+        list: optimizeFile() results in the same order as paths
+    """
+    import multiprocessing
+
+    jobs = [(path, optimize, setting, cache, cachefields) for path in paths]
+    if pool is not None:
+        return pool.map(_optimizeFileJob, jobs)
+    processes = min(processes or 1, len(jobs))
+    if processes > 1 and not multiprocessing.current_process().daemon:
+        pool = spawnContext().Pool(processes)
+        try:
+            return pool.map(_optimizeFileJob, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    return [_optimizeFileJob(job) for job in jobs]
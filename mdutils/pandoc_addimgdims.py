@@ -44,81 +44,217 @@
     ```
 """
 
-__version__ = "0.4.4"
+__version__ = "0.4.5"
 
-import json
+import functools
 import os
-import sys
+import re
+import struct
+import xml.parsers.expat
 
-try:
+from pandocfilters import Image, toJSONFilter
+
+from mdutils.pandoc_pipeline import FilterContext
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+SVG_LENGTH_RE = re.compile(r"^\s*([0-9.]+)\s*(px)?\s*$")
+SVG_VIEWBOX_RE = re.compile(r"[\s,]+")
+SVG_CHUNK = 4096
+DIM_KEYS = ("width", "height")
+# JPEG start-of-frame markers, which hold the size
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - frozenset((0xC4, 0xC8, 0xCC))
+
+
+def toPx(value):
+    return int(round(float(value)))
+
+
+class RootFound(Exception):
     pass
-except:
-    pprint("PIL or Pillow not found, run: pip install --user Pillow")
 
-from pandocfilters import Image, toJSONFilter
 
+def pngSize(path):
+    """
+    Read the size from the IHDR chunk, which PNG requires to come first.
+
+    Returns:
+        tuple: (width, height) in px, or None
+    """
+    with open(path, "rb") as pngfile:
+        header = pngfile.read(24)
+    if len(header) < 24 or header[:8] != PNG_SIGNATURE or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
 
-def pprint(s):
-    log = sys.stderr
-    log.write(unicode(s).encode("utf-8"))
-    log.write(b"\n")
-    log.flush()
+
+def jpegSize(path):
+    """
+    Read the size from the first start-of-frame segment, skipping the
+    segments before it without reading the image data.
+
+    Returns:
+        tuple: (width, height) in px, or None
+    """
+    with open(path, "rb") as jpegfile:
+        if jpegfile.read(2) != b"\xff\xd8":
+            return None
+        while True:
+            byte = jpegfile.read(1)
+            while byte and byte != b"\xff":
+                byte = jpegfile.read(1)
+            # Markers may be padded with any number of 0xFF
+            while byte == b"\xff":
+                byte = jpegfile.read(1)
+            if not byte:
+                return None
+            marker = ord(byte)
+            if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+                # No length
+                continue
+            length = jpegfile.read(2)
+            if len(length) < 2:
+                return None
+            length = struct.unpack(">H", length)[0]
+            if marker in JPEG_SOF_MARKERS:
+                frame = jpegfile.read(5)
+                if len(frame) < 5:
+                    return None
+                height, width = struct.unpack(">HH", frame[1:5])
+                return (width, height)
+            jpegfile.seek(length - 2, 1)
+
+
+def gifSize(path):
+    """
+    Read the size from the GIF logical screen descriptor.
+
+    Returns:
+        tuple: (width, height) in px, or None
+    """
+    with open(path, "rb") as giffile:
+        header = giffile.read(10)
+    if len(header) < 10 or header[:4] != b"GIF8":
+        return None
+    return struct.unpack("<HH", header[6:10])
+
+
+def svgSize(path):
+    """
+    Read the size from the root <svg> element only: its width and height
+    if they are in px, otherwise its viewBox. Parsing stops at the root.
+
+    Returns:
+        tuple: (width, height) in px, or None
+    """
+    root = {}
+
+    def startElement(name, attrs):
+        root.update(attrs)
+        raise RootFound()
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = startElement
+    try:
+        with open(path, "rb") as svgfile:
+            for chunk in iter(lambda: svgfile.read(SVG_CHUNK), b""):
+                parser.Parse(chunk, False)
+    except RootFound:
+        pass
+    except xml.parsers.expat.ExpatError:
+        return None
+    width = SVG_LENGTH_RE.match(root.get("width", ""))
+    height = SVG_LENGTH_RE.match(root.get("height", ""))
+    try:
+        if width and height:
+            return (toPx(width.group(1)), toPx(height.group(1)))
+        viewbox = SVG_VIEWBOX_RE.split(root.get("viewBox", "").strip())
+        if len(viewbox) == 4:
+            return (toPx(viewbox[2]), toPx(viewbox[3]))
+    except ValueError:
+        pass
+    return None
+
+
+PROBES = {
+    ".png": pngSize,
+    ".jpg": jpegSize,
+    ".jpeg": jpegSize,
+    ".gif": gifSize,
+    ".svg": svgSize,
+}
+
+
+def imageSize(path, context):
+    """
+    Args:
+        path (str): image file
+        context (FilterContext): holds the sizes found so far
+
+    Returns:
+        tuple: (width, height) in px, or None if unknown, memoized per file
+    """
+    if path not in context.imgdims:
+        probe = PROBES.get(os.path.splitext(path)[1].lower())
+        size = None
+        if probe:
+            try:
+                size = probe(path)
+            except (IOError, OSError, struct.error):
+                size = None
+        if size and (size[0] <= 0 or size[1] <= 0):
+            size = None
+        context.imgdims[path] = size
+    return context.imgdims[path]
+
+
+def recalcAttrs(attrs, size, maxdims):
+    """
+    Returns:
+        list: attrs with width and height in px, or width 100% if the
+        image is wider than maxdims
+    """
+    ident, classes, keyvals = attrs
+    keyvals = [kv for kv in keyvals if kv[0] not in DIM_KEYS]
+    width, height = size
+    if width <= maxdims:
+        keyvals.append(["width", "%dpx" % (width)])
+        keyvals.append(["height", "%dpx" % (height)])
+    else:
+        keyvals.append(["width", "100%"])
+    return [ident, classes, keyvals]
 
 
-def pandoc_addimgdims(key, value, format, meta):
+def pandoc_addimgdims(key, value, format, meta, context):
     """
+    With recalcimgdims, replace the width and height of images with the
+    size of their files in the destination folder. keepimgdims takes
+    precedence and keeps the original sizes.
 
     Args:
         key ():
         value ():
         format ():
         meta ():
+        context (FilterContext): settings and state of this walk
 
     Returns:
         pandocfilters.Image()
     """
     if key == "Image":
-        (
-            True if os.environ.get("pandoc_filter_keepimgdims", "0") == "1" else False
-        )
-        (
-            True if os.environ.get("pandoc_filter_recalcimgdims", "0") == "1" else False
-        )
-        recalcmaxdims = os.environ.get("pandoc_filter_recalcmaxdims", "500")
-        try:
-            recalcmaxdims = int(recalcmaxdims)
-        except ValueError:
-            recalcmaxdims = 500
-        mediainfopath = os.environ.get("pandoc_filter_mapmedia", None)
         attrs, alt, [src, title] = value
-        if not mediainfopath:
+        if not context.mediainfo or context.keepimgdims or not context.recalcimgdims:
             return Image(attrs, alt, [src, title])
 
-        mediainfo = json.load(file(mediainfopath))
-        dstfolder = mediainfo["dstfull"]
-
-        os.path.join(dstfolder, os.path.split(src)[1])
-
-        # if os.path.splitext(srcpath)[1].lower() == ".svg":
-        #    pil = PIL.Image.open(srcpath)
-        #    pprint("%s %s" % (src, pil.size))
-        #    pprint(recalcmaxdims)
-        #
-        # elif os.path.splitext(srcpath)[1].lower() == ".png":
-        #    pil = PIL.Image.open(srcpath)
-        #    pprint("%s %s" % (src, pil.size))
-        #    pprint(recalcmaxdims)
-        #
-        # pprint("key: %s" % repr(key))
-        # pprint("attrs: %s" % repr(attrs))
-        # pprint("alt: %s" % repr(alt))
-        # pprint("src: %s" % repr(src))
-        # pprint("title: %s" % repr(title))
-        # pprint("format: %s" % repr(format))
-        # pprint("meta: %s" % repr(meta))
+        dstpath = os.path.join(context.dstfolder, os.path.basename(src))
+        size = imageSize(dstpath, context)
+        if size:
+            attrs = recalcAttrs(attrs, size, context.recalcmaxdims)
 
         return Image(attrs, alt, [src, title])
 
 
 if __name__ == "__main__":
-    toJSONFilter(pandoc_addimgdims)
+    # One context per run, as pandoc starts the filter once per document
+    toJSONFilter(
+        functools.partial(pandoc_addimgdims, context=FilterContext.fromEnviron())
+    )
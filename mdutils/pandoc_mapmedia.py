@@ -46,19 +46,17 @@ Pandoc filter to aid conversion of WMF files to SVG or PNG.
 
 __version__ = "0.4.4"
 
-import json
+import functools
 import os
-import shutil
 import string
-import sys
 
 from pandocfilters import Image, Str, stringify, toJSONFilter
 
+from mdutils.pandoc_pipeline import FilterContext
+from mdutils.placefile import placeFile
 
-def pprint(s):
-    sys.stderr.write(unicode(s).encode("utf-8"))
-    sys.stderr.write(b"\n")
-    sys.stderr.flush()
+# Hex digits of the content hash in image pool file names
+HASH_LENGTH = 16
 
 
 def extractAlphanumeric(InputString):
@@ -67,13 +65,14 @@ def extractAlphanumeric(InputString):
     )
 
 
-def pandoc_wmftosvgpng(key, value, format, meta):
+def pandoc_wmftosvgpng(key, value, format, meta, context):
     """
     Args:
         key ():
         value ():
         format ():
         meta ():
+        context (FilterContext): settings and state of this walk
 
     Returns:
         pandocfilters.Image()
@@ -81,24 +80,16 @@ def pandoc_wmftosvgpng(key, value, format, meta):
     if key == "Image":
         attrs, alt, [src, title] = value
 
-        mediainfopath = os.environ.get("pandoc_filter_mapmedia", None)
-        if not mediainfopath:
+        if not context.mediainfo:
             return Image(attrs, alt, [src, title])
 
-        mediainfo = json.load(file(mediainfopath))
-        srcfolder = mediainfo["srcfull"]
-        dstfolder = mediainfo["dstfull"]
-        mediainfo["srcsubstr"]
-        dstsubstr = mediainfo["dstsubstr"]
-        mediamap = mediainfo["map"]
-
         newsrc = src
         srcfn = os.path.basename(src)
-        mapfn = mediamap.get(srcfn, srcfn)
+        mapfn = context.mediamap.get(srcfn, srcfn)
         dstfn = mapfn
 
         dstbase, dstext = os.path.splitext(mapfn)
-        prefix = mediainfo["prefix"]
+        prefix = context.prefix
         newbase = dstbase[5:].zfill(4)
 
         suffix = ""
@@ -109,6 +100,10 @@ def pandoc_wmftosvgpng(key, value, format, meta):
             suffix = "_" + altstr
 
         dstfn = prefix + "_" + newbase + suffix + dstext
+        if context.imgpool and mapfn in context.hashes:
+            dstfn = context.hashes[mapfn][:HASH_LENGTH] + dstext
+        elif context.dedupe:
+            dstfn = context.dstnames.setdefault(mapfn, dstfn)
 
         if altstr:
             altstr = prefix + "_" + altstr
@@ -116,20 +111,26 @@ def pandoc_wmftosvgpng(key, value, format, meta):
             altstr = prefix + "_" + newbase
         alt = [Str(altstr)]
         if not title:
-            title = unicode(altstr)
+            title = altstr
 
-        newsrc = os.path.join(dstsubstr, dstfn)
-        srcpath = os.path.join(srcfolder, mapfn)
-        dstpath = os.path.join(dstfolder, dstfn)
+        newsrc = os.path.join(context.dstsubstr, dstfn)
+        srcpath = os.path.join(context.srcfolder, mapfn)
+        dstpath = os.path.join(context.dstfolder, dstfn)
 
-        if os.path.exists(dstpath):
-            os.remove(dstpath)
-        shutil.copyfile(srcpath, dstpath)
+        # Images used several times are placed once
+        if dstfn not in context.placed:
+            method = placeFile(srcpath, dstpath, shared=context.imgpool)
+            if method:
+                context.placements[method] = context.placements.get(method, 0) + 1
+            context.placed[dstfn] = srcfn
 
-        src = unicode(newsrc)
+        src = newsrc
 
         return Image(attrs, alt, [src, title])
 
 
 if __name__ == "__main__":
-    toJSONFilter(pandoc_wmftosvgpng)
+    # One context per run, as pandoc starts the filter once per document
+    context = FilterContext.fromEnviron()
+    toJSONFilter(functools.partial(pandoc_wmftosvgpng, context=context))
+    context.writePlaced()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+In-process runner for the mdutils pandoc filters.
+
+  Copyright (c) 2016 by Adam Twardoch, licensed under Apache 2
+  https://github.com/twardoch/markdown-utils
+
+Pandoc runs each `--filter` script as its own process, which parses
+and serializes the complete document JSON once per filter. This module
+applies any number of `pandocfilters`-style actions to an already
+loaded AST in a single tree walk, so the document is parsed once and
+serialized once no matter how many filters run.
+
+  * Usage in Python:
+    ```python
+    from mdutils import pandoc_addimgdims, pandoc_mapmedia, pandoc_pipeline
+    doc = json.load(open('doc.json'))
+    # One context per walk: it records the images placed so far
+    context = pandoc_pipeline.FilterContext('doc.media.json')
+    doc = pandoc_pipeline.applyFilters(doc, [
+        functools.partial(pandoc_mapmedia.pandoc_wmftosvgpng, context=context),
+        functools.partial(pandoc_addimgdims.pandoc_addimgdims, context=context),
+    ], 'markdown')
+    ```
+"""
+
+__version__ = "0.4.5"
+
+import json
+import os
+
+from pandocfilters import walk
+
+
+class FilterContext:
+    """
+    Settings shared by the mapmedia and addimgdims filters: the parsed
+    .media.json mapping and the image dimension options. Built once per
+    filter run instead of once per Image node, and not reused for another
+    run, since it also records the images placed and measured.
+    """
+
+    def __init__(
+        self,
+        mediainfopath=None,
+        mediainfo=None,
+        keepimgdims=False,
+        recalcimgdims=False,
+        recalcmaxdims=500,
+    ):
+        """
+        Args:
+            mediainfopath (str): path to the .media.json written by docxtomd
+            mediainfo (dict): already loaded media info, skips reading the file
+            keepimgdims (bool): keep original image height and width
+            recalcimgdims (bool): recalculate image px height and width
+            recalcmaxdims (int): max image width in px
+        """
+        if mediainfo is None and mediainfopath:
+            with open(mediainfopath) as mediainfofile:
+                mediainfo = json.load(mediainfofile)
+        self.mediainfopath = mediainfopath
+        self.mediainfo = mediainfo
+        self.keepimgdims = keepimgdims
+        self.recalcimgdims = recalcimgdims
+        self.recalcmaxdims = recalcmaxdims
+        # Image files written to dstfolder -> source media file name
+        self.placed = {}
+        # Placement method ('link', 'reflink', 'copy') -> number of files
+        self.placements = {}
+        # Image file path -> (width, height) in px, or None
+        self.imgdims = {}
+        if mediainfo:
+            self.srcfolder = mediainfo["srcfull"]
+            self.dstfolder = mediainfo["dstfull"]
+            self.dstsubstr = mediainfo["dstsubstr"]
+            self.prefix = mediainfo["prefix"]
+            self.mediamap = mediainfo["map"]
+            # With dedupe, all Image nodes of the same media file share
+            # one image; in an image pool it is named by content hash
+            self.dedupe = mediainfo.get("dedupe", False)
+            self.imgpool = mediainfo.get("imgpool", False)
+            self.hashes = mediainfo.get("hashes", {})
+            self.dstnames = {}
+            # Where a filter run under pandoc reports the images it placed
+            self.placedpath = mediainfo.get("placedpath", None)
+
+    @classmethod
+    def fromEnviron(cls, environ=None):
+        """
+        Read the settings that docxtomd passes to --filter scripts
+        through the environment.
+        """
+        if environ is None:
+            environ = os.environ
+        try:
+            recalcmaxdims = int(environ.get("pandoc_filter_recalcmaxdims", "500"))
+        except ValueError:
+            recalcmaxdims = 500
+        return cls(
+            mediainfopath=environ.get("pandoc_filter_mapmedia", None),
+            keepimgdims=environ.get("pandoc_filter_keepimgdims", "0") == "1",
+            recalcimgdims=environ.get("pandoc_filter_recalcimgdims", "0") == "1",
+            recalcmaxdims=recalcmaxdims,
+        )
+
+    def writePlaced(self):
+        """
+        Write the images placed and the placement methods to placedpath,
+        if .media.json names one, so that docxtomd can record them when
+        the filters run as pandoc --filter processes.
+        """
+        if not self.mediainfo or not self.placedpath:
+            return
+        with open(self.placedpath, "w") as placedfile:
+            json.dump(
+                {"placed": self.placed, "placements": self.placements}, placedfile
+            )
+
+
+def composeFilters(actions):
+    """
+    Combine several filter actions into one, so that a single walk
+    applies all of them in order to each element.
+
+    Each action sees the element as returned by the previous one.
+    If an action returns a list (to splice several elements in place
+    of one), the remaining actions are not applied to that element.
+
+    Args:
+        actions (list): pandocfilters actions (key, value, format, meta)
+
+    Returns:
+        function: a pandocfilters action
+    """
+
+    def composed(key, value, format, meta):
+        result = None
+        for action in actions:
+            res = action(key, value, format, meta)
+            if res is None:
+                continue
+            if isinstance(res, list):
+                return res
+            result = res
+            key, value = res["t"], res.get("c")
+        return result
+
+    return composed
+
+
+def getMeta(doc):
+    """
+    Args:
+        doc (dict|list): pandoc JSON AST
+
+    Returns:
+        dict: document metadata, for either AST layout
+    """
+    if isinstance(doc, dict):
+        return doc.get("meta", {})
+    return doc[0]["unMeta"]
+
+
+def applyFilters(doc, actions, format=""):
+    """
+    Args:
+        doc (dict|list): pandoc JSON AST, as loaded by json.load()
+        actions (list): pandocfilters actions
+        format (str): target format passed to the actions
+
+    Returns:
+        dict|list: the rewritten AST
+    """
+    return walk(doc, composeFilters(actions), format, getMeta(doc))
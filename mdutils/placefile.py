@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""placefile
+  Place files without copying their bytes where possible
+  Copyright (c) 2016 by Adam Twardoch, licensed under Apache 2
+  https://github.com/twardoch/markdown-utils
+
+docxtomd works in a private folder next to the output, so converted
+media can usually be hardlinked into img/ instead of copied: the
+working folder is deleted afterwards, which leaves the image as a
+plain file. Across filesystems, or where hardlinks are not allowed,
+a copy-on-write clone (reflink, on btrfs, XFS and similar) is tried,
+and only then a real copy.
+
+Usage in Python:
+  from mdutils import placefile
+  method = placefile.placeFile('work/media/image1.svg', 'img/doc_0001.svg')
+  # 'link', 'reflink' or 'copy'
+"""
+
+__version__ = "0.4.5"
+
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl of Linux, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+METHODS = ("link", "reflink", "copy")
+
+
+def cloneFile(srcpath, dstpath):
+    """
+    Create dstpath as a copy-on-write clone of srcpath.
+
+    Returns:
+        bool: False if the platform or filesystem cannot clone
+    """
+    if fcntl is None:
+        return False
+    try:
+        with open(srcpath, "rb") as srcfile:
+            with open(dstpath, "wb") as dstfile:
+                fcntl.ioctl(dstfile.fileno(), FICLONE, srcfile.fileno())
+    except (IOError, OSError):
+        if os.path.exists(dstpath):
+            os.remove(dstpath)
+        return False
+    return True
+
+
+def placeFile(srcpath, dstpath, link=True, shared=False):
+    """
+    Put the contents of srcpath at dstpath, replacing dstpath.
+
+    Args:
+        srcpath (str): existing file
+        dstpath (str): target path
+        link (bool): allow a hardlink; use False if either file may later
+            be changed in place, e.g. in a cache
+        shared (bool): dstpath is named after its contents and may be
+            placed by other processes too: keep an existing dstpath, and
+            make a new one appear atomically
+
+    Returns:
+        str: the method used, one of METHODS, or None if dstpath was
+        already in place
+    """
+    if os.path.exists(dstpath):
+        if shared or os.path.samefile(srcpath, dstpath):
+            return None
+        os.remove(dstpath)
+    if shared:
+        fd, tmppath = tempfile.mkstemp(
+            dir=os.path.dirname(dstpath), prefix=".", suffix=".tmp"
+        )
+        os.close(fd)
+        try:
+            method = placeFile(srcpath, tmppath, link)
+            os.rename(tmppath, dstpath)
+        except (IOError, OSError):
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+        return method
+    if link:
+        try:
+            os.link(srcpath, dstpath)
+            return "link"
+        except (AttributeError, OSError):
+            pass
+    if cloneFile(srcpath, dstpath):
+        return "reflink"
+    shutil.copyfile(srcpath, dstpath)
+    return "copy"
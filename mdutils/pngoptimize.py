@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""pngoptimize
+  Lossless PNG recompression with Pillow
+  Copyright (c) 2016 by Adam Twardoch, licensed under Apache 2
+  https://github.com/twardoch/markdown-utils
+
+Rewrites PNG images smaller without changing a pixel: tries several
+zlib levels and strategies, and stores images with up to 256 colors as
+palette images. Text, time and EXIF chunks are dropped; the chunks that
+change how an image renders (gAMA, cHRM, sRGB, iCCP, pHYs) are copied
+unchanged. The smallest result wins, and only if decoding it gives the
+same pixels; otherwise the original is kept. 16-bit images, grayscale
+below 8 bits and images with sBIT, bKGD, hIST or sPLT chunks are kept
+as they are, since Pillow cannot write them back unchanged.
+
+Usage in shell:
+  $ python -m mdutils.pngoptimize -l max -j 4 img/*.png
+
+Usage in Python:
+  from mdutils import mediacache, pngoptimize
+  data = pngoptimize.optimizePng(open('in.png', 'rb').read(), 'default')
+  for result in pngoptimize.optimizePngFiles(
+          paths, 'max', processes=4,
+          cache=mediacache.MediaCache('~/.cache/mdutils')):
+      print(result['path'], result['bytes_in'], result['bytes_out'])
+"""
+
+__version__ = "0.4.6"
+
+import argparse
+import io
+import struct
+import warnings
+
+from mdutils import mediaoptimize
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Chunks that change how an image renders, copied to the output as they are
+KEPT_CHUNKS = (b"gAMA", b"cHRM", b"sRGB", b"iCCP", b"pHYs")
+# Chunks that depend on the color type and bit depth; images with them
+# are not rewritten
+TYPED_CHUNKS = (b"sBIT", b"bKGD", b"hIST", b"sPLT")
+
+# zlib strategies: Z_DEFAULT_STRATEGY, Z_FILTERED, Z_HUFFMAN_ONLY, Z_RLE,
+# Z_FIXED
+# Compression settings tried per level: (compress_level, compress_type)
+PNG_LEVELS = {
+    "fast": ((9, 0),),
+    "default": ((9, 0), (9, 1), (9, 3)),
+    "max": ((9, 0), (9, 1), (9, 2), (9, 3), (9, 4), (6, 0), (6, 1)),
+}
+
+
+def pillowVersion():
+    try:
+        import PIL
+    except ImportError:
+        return None
+    return getattr(PIL, "__version__", "unknown")
+
+
+def pngChunks(data):
+    """
+    Args:
+        data (bytes): PNG
+
+    Returns:
+        list: (type, chunk) pairs, chunk being the complete chunk bytes
+    """
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG")
+    chunks = []
+    offset = 8
+    while offset + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[offset : offset + 8])
+        end = offset + 12 + length
+        chunks.append((kind, data[offset:end]))
+        offset = end
+        if kind == b"IEND":
+            break
+    return chunks
+
+
+def isRewritable(chunks):
+    """
+    Returns:
+        bool: False if Pillow cannot write the image back unchanged
+    """
+    if not chunks or chunks[0][0] != b"IHDR":
+        return False
+    bitdepth, colortype = struct.unpack(">BB", chunks[0][1][16:18])
+    if bitdepth == 16:
+        return False
+    # Pillow reads 2- and 4-bit grayscale as 8-bit
+    if colortype == 0 and bitdepth in (2, 4):
+        return False
+    return not [kind for kind, chunk in chunks if kind in TYPED_CHUNKS]
+
+
+def insertChunks(data, chunks):
+    """
+    Insert chunks right after IHDR, where all of KEPT_CHUNKS may be.
+    """
+    if not chunks:
+        return data
+    # Signature and IHDR, which always holds 13 bytes
+    return data[:33] + b"".join(chunks) + data[33:]
+
+
+def samePixels(image, data):
+    from PIL import Image
+
+    other = Image.open(io.BytesIO(data))
+    return (
+        image.size == other.size
+        and image.convert("RGBA").tobytes() == other.convert("RGBA").tobytes()
+    )
+
+
+def toPalette(image):
+    """
+    Returns:
+        PIL.Image.Image: image as an exact palette image, or None if it
+        has more than 256 colors or cannot be stored as one
+    """
+    from PIL import Image
+
+    if image.mode not in ("RGB", "RGBA") or "transparency" in image.info:
+        # A color key of RGB has no palette equivalent in Pillow
+        return None
+    colors = image.getcolors(256)
+    if not colors:
+        return None
+    if image.mode == "RGBA":
+        palette = image.quantize(colors=len(colors), method=Image.FASTOCTREE)
+    else:
+        palette = image.quantize(colors=len(colors), method=Image.MEDIANCUT)
+    # Only used if no pixel changed
+    if palette.convert(image.mode).tobytes() != image.tobytes():
+        return None
+    return palette
+
+
+def optimizePng(data, level="default"):
+    """
+    Args:
+        data (bytes): PNG
+        level (str): name in PNG_LEVELS
+
+    Returns:
+        bytes: the smallest PNG found, or data if nothing is smaller
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        warnings.warn("PIL or Pillow not found, run: pip install --user Pillow")
+        return data
+    try:
+        chunks = pngChunks(data)
+        if not isRewritable(chunks):
+            return data
+        kept = [chunk for kind, chunk in chunks if kind in KEPT_CHUNKS]
+        image = Image.open(io.BytesIO(data))
+        if getattr(image, "n_frames", 1) > 1:
+            # Keep animated PNG as it is
+            return data
+        image.load()
+        info = {}
+        if "transparency" in image.info:
+            info["transparency"] = image.info["transparency"]
+        candidates = [(image, info)]
+        palette = toPalette(image)
+        if palette is not None:
+            candidates.append((palette, {}))
+        best = data
+        for candidate, candidateinfo in candidates:
+            # iCCP is copied from the original with the other kept chunks
+            candidate.info.pop("icc_profile", None)
+            for compresslevel, compresstype in PNG_LEVELS[level]:
+                output = io.BytesIO()
+                candidate.save(
+                    output,
+                    "PNG",
+                    compress_level=compresslevel,
+                    compress_type=compresstype,
+                    **candidateinfo
+                )
+                result = insertChunks(output.getvalue(), kept)
+                if len(result) < len(best):
+                    best = result
+        if best is not data and not samePixels(image, best):
+            warnings.warn("PNG optimization changed pixels, keeping the original")
+            return data
+    except Exception as e:
+        warnings.warn("Cannot optimize PNG: %s" % (e))
+        return data
+    return best
+
+
+def pngCacheFields(level):
+    """
+    Returns:
+        dict: what identifies PNG optimized at level in the cache
+    """
+    return {
+        "converter": "pngoptimize",
+        "version": __version__,
+        "level": level,
+        "pillow": pillowVersion(),
+    }
+
+
+def optimizePngFile(path, level="default", cache=None):
+    """
+    Optimize a PNG file in place, see mediaoptimize.optimizeFile().
+
+    Args:
+        path (str): .png file
+        level (str): name in PNG_LEVELS
+        cache (mediacache.MediaCache): optional cache of optimized PNG
+
+    Returns:
+        dict: path, bytes_in, bytes_out, seconds, cached
+    """
+    return mediaoptimize.optimizeFile(
+        path, optimizePng, level, cache, pngCacheFields(level)
+    )
+
+
+def optimizePngFiles(paths, level="default", processes=1, cache=None, pool=None):
+    """
+    Optimize many PNG files in place, in a pool of processes, see
+    mediaoptimize.optimizeFiles().
+
+    Args:
+        paths (list): .png files
+        level (str): name in PNG_LEVELS
+        processes (int): max number of processes
+        cache (mediacache.MediaCache): optional cache of optimized PNG
+        pool (multiprocessing.pool.Pool): optional pool to run in
+
+    Returns:
+        list: optimizePngFile() results in the same order as paths
+    """
+    return mediaoptimize.optimizeFiles(
+        optimizePng, paths, level, processes, cache, pool, pngCacheFields(level)
+    )
+
+
+def parseOptions():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("paths", nargs="+", help="PNG files, optimized in place")
+    parser.add_argument(
+        "-l",
+        "--level",
+        choices=sorted(PNG_LEVELS),
+        default="default",
+        help="settings to try, from fastest to smallest: fast, default, max; "
+        "default: default",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of files to optimize in parallel, default: 1",
+    )
+    parser.add_argument(
+        "-V", "--version", action="version", version="%(prog)s (" + __version__ + ")"
+    )
+    return vars(parser.parse_args())
+
+
+def main():
+    opts = parseOptions()
+    for result in optimizePngFiles(opts["paths"], opts["level"], opts["jobs"]):
+        print(
+            "%8d -> %8d  %6.2fs  %s"
+            % (
+                result["bytes_in"],
+                result["bytes_out"],
+                result["seconds"],
+                result["path"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,26 +4,45 @@ THIS IS UNDER DEVELOPMENT
 """
 
 import argparse
+import io
 import os
 import re
+import threading
 
+# A heading: its level is the number of leading #
+HEADING_RE = re.compile(r"(#+)[^#](.*)")
+LINKDEF_RE = re.compile(r"(\[.+?\]):.*")
+# Every bracketed token, including overlapping ones like [[a]]
+LINKREF_RE = re.compile(r"(?=(\[[^\[\]\n]*\]))")
+# Link keys that LINKREF_RE can find; others are searched as substrings
+SIMPLE_KEY_RE = re.compile(r"\[[^\[\]\n]*\]\Z")
+TITLE_TAG_RE = re.compile(r"<.*?>")
+TITLE_CHARS_RE = re.compile(r'[*_/\\:."\'+$><|]')
+TITLE_DASH_RE = re.compile(r"–—•")
+TITLE_SPACE_RE = re.compile(r" ")
 
-# Main function
+
+# Main function. The document is read twice, lazily: once to collect the
+# link definitions, then to split it, so that memory use is bounded by
+# the largest section, not by the whole document.
 def main(args):
     docname = args.get("inpath", None)
-    docfile = file(docname)
-    maintext = docfile.readlines()
-    if len(maintext) == 0:
+    if os.path.getsize(docname) == 0:
         print("Document is Empty!")
         return
-    os.path.split(docname)[0]
     file_dir = os.path.splitext(docname)[0]
     make_groups = int(args.get("groups"))
-    levels = str(args.get("levels"))
+    levels = int(args.get("levels"))
+
+    jobs = int(args.get("jobs") or 1)
 
     links = {}
-    textlines = extract_links(maintext, links)
-    split_file(file_dir, textlines, make_groups, levels, links)
+    with io.open(docname, encoding="utf-8") as docfile:
+        dirs = scan_document(docfile, links, make_groups)
+    with io.open(docname, encoding="utf-8") as docfile:
+        split_file(
+            file_dir, text_lines(docfile), make_groups, levels, links, jobs, dirs
+        )
 
 
 # Extract all end of page links and footnotes, and store them in dict for
@@ -33,7 +52,7 @@ def main(args):
 def extract_links(maintext, links):
     textlines = []
     for line in maintext:
-        m = re.match(r"(\[.+?\]):.*", line)
+        m = LINKDEF_RE.match(line)
         if m:
             key = m.group(1)
             links[key] = line
@@ -42,11 +61,56 @@ def extract_links(maintext, links):
     return textlines
 
 
+# Same as extract_links, for a file or other iterable read only once,
+# without keeping the text
+def scan_links(lines, links):
+    for line in lines:
+        m = LINKDEF_RE.match(line)
+        if m:
+            links[m.group(1)] = line
+    return links
+
+
+# scan_links, and with make_groups also the group dirs that split_file
+# will create, relative to its file_dir
+def scan_document(lines, links, make_groups=0):
+    dirs = []
+    gr1 = ""
+    grindex = 0
+    for line in lines:
+        m = LINKDEF_RE.match(line)
+        if m:
+            links[m.group(1)] = line
+            continue
+        if make_groups > 0:
+            h = HEADING_RE.match(line)
+            level = len(h.group(1)) if h else 0
+            if level == 1:
+                grindex += 1
+                gr1 = make_group((h.group(2),), grindex)
+                dirs.append(gr1)
+            elif level == 2 and make_groups == 2:
+                grindex += 1
+                dirs.append(os.path.join(gr1, make_group((h.group(2),), grindex)))
+    return dirs
+
+
+# The lines that extract_links would return, one at a time
+def text_lines(lines):
+    for line in lines:
+        if not LINKDEF_RE.match(line):
+            yield line
+
+
 # Split .md file on h1 and h2 (#, ##) sections, option for grouping in sub
-# dirs on h1
-def split_file(file_dir, textlines, make_groups, levels, links):
-    if not os.path.isdir(file_dir):
-        os.makedirs(file_dir)
+# dirs on h1. textlines can be any iterable; each section is written as
+# soon as the next heading is reached. With jobs > 1, sections are written
+# by a thread pool. dirs, as returned by scan_document(), lets all group
+# dirs be created up front.
+def split_file(file_dir, textlines, make_groups, levels, links, jobs=1, dirs=None):
+    made = make_dirs(file_dir, dirs or [])
+    levels = int(levels)
+    writer = SectionWriter(links, jobs)
     section = []
     out_dir = file_dir
     sub_dir = file_dir
@@ -54,65 +118,129 @@ def split_file(file_dir, textlines, make_groups, levels, links):
     findex = 0
     grindex = 0
     ml = ("index",)
-    for line in textlines:
-        m = re.match("#[^#](.*)", line)
-        if m and make_groups > 0:
-            grindex += 1
-            ml = m.groups()
-            gr1 = make_group(ml, grindex)
-            gr2 = ""
-            sub_dir = os.path.join(file_dir, gr1)
-            os.makedirs(sub_dir)
-
-        m2 = re.match("##[^#](.*)", line)
-        if m2 and make_groups == 2:
-            grindex += 1
-            ml2 = m2.groups()
-            gr2 = make_group(ml2, grindex)
-            sub_dir = os.path.join(file_dir, gr1, gr2)
-            os.makedirs(sub_dir)
-
-        if re.match("#{1," + levels + "}[^#]", line):
-            if len(section) > 0:
-                ml = ("index",)
-                if m2:
-                    ml = m2.groups()
-                elif m:
-                    ml = m.groups()
-                writefile(out_dir, ml, findex, "\n".join(section), links)
-            section = []
-            findex += 1
-            out_dir = sub_dir
-        section.append(line)
-    # write last section (or complete doc, if no sections)
-    if len(section) > 0:
-        writefile(out_dir, ml, findex, "\n".join(section), links)
+    try:
+        for line in textlines:
+            m = HEADING_RE.match(line)
+            level = len(m.group(1)) if m else 0
+            if level == 1 and make_groups > 0:
+                grindex += 1
+                ml = (m.group(2),)
+                gr1 = make_group(ml, grindex)
+                gr2 = ""
+                sub_dir = os.path.join(file_dir, gr1)
+                if sub_dir not in made:
+                    os.makedirs(sub_dir)
+
+            if level == 2 and make_groups == 2:
+                grindex += 1
+                gr2 = make_group((m.group(2),), grindex)
+                sub_dir = os.path.join(file_dir, gr1, gr2)
+                if sub_dir not in made:
+                    os.makedirs(sub_dir)
+
+            if m and level <= levels:
+                if len(section) > 0:
+                    ml = ("index",)
+                    if level <= 2:
+                        ml = (m.group(2),)
+                    writer.write(out_dir, ml, findex, section)
+                section = []
+                findex += 1
+                out_dir = sub_dir
+            section.append(line)
+        # write last section (or complete doc, if no sections)
+        if len(section) > 0:
+            writer.write(out_dir, ml, findex, section)
+    finally:
+        writer.close()
+
+
+# Create file_dir and the group dirs below it in one go, parents first
+def make_dirs(file_dir, dirs):
+    made = set()
+    for path in [file_dir] + [os.path.join(file_dir, d) for d in dirs]:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        made.add(path)
+    return made
+
+
+# Write sections, in a thread pool if jobs > 1. At most 2 * jobs sections
+# wait to be written at any time, so memory stays bounded when writing
+# is slower than splitting.
+class SectionWriter:
+    def __init__(self, links, jobs=1):
+        self.links = links
+        self.nested = nested_keys(links)
+        self.pool = None
+        self.pending = []
+        if jobs > 1:
+            from multiprocessing.pool import ThreadPool
+
+            self.pool = ThreadPool(jobs)
+            self.slots = threading.BoundedSemaphore(2 * jobs)
+
+    def write(self, file_dir, ml, index, section):
+        if not self.pool:
+            writefile(file_dir, ml, index, "\n".join(section), self.links, self.nested)
+            return
+        self.slots.acquire()
+        # Forget finished writes; get() raises the error of a failed one
+        for result in [r for r in self.pending if r.ready()]:
+            result.get()
+            self.pending.remove(result)
+        self.pending.append(
+            self.pool.apply_async(self.run, (file_dir, ml, index, section))
+        )
+
+    def run(self, file_dir, ml, index, section):
+        try:
+            writefile(file_dir, ml, index, "\n".join(section), self.links, self.nested)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            # Raise the first error from a worker, if any
+            for result in self.pending:
+                result.get()
 
 
 def make_group(ml, index):
     title = ml[0].strip()
-    title = re.sub(r"<.*?>", "", title)
-    title = re.sub(r'[*_/\\:."\'+$><|]', "", title)
-    title = re.sub(r"–—•", "-", title)
-    title = re.sub(r" ", "-", title)
+    title = TITLE_TAG_RE.sub("", title)
+    title = TITLE_CHARS_RE.sub("", title)
+    title = TITLE_DASH_RE.sub("-", title)
+    title = TITLE_SPACE_RE.sub("-", title)
     return str(index).zfill(2) + "-" + title[:59]
 
 
 # Write section and add matching links at end
-def writefile(file_dir, ml, index, text, links):
-    newtext = check_links(text, links)
+def writefile(file_dir, ml, index, text, links, nested=None):
+    newtext = check_links(text, links, nested)
     fname = os.path.join(file_dir, make_group(ml, index) + ".md")
-    f = open(fname, "w")
-    f.write(newtext)
-    f.close()
+    with io.open(fname, "w", encoding="utf-8") as f:
+        f.write(newtext)
 
 
-# Check for any reference to links or footnotes, and add if found
-def check_links(text, links):
-    linkline = []
-    for key, val in sorted(links.iteritems()):
-        if key in text:
-            linkline.append(val)
+# Link keys with brackets inside, which cannot be looked up by token
+def nested_keys(links):
+    return sorted(key for key in links if not SIMPLE_KEY_RE.match(key))
+
+
+# Check for any reference to links or footnotes, and add if found. The
+# bracketed tokens of the text are collected in one scan and looked up,
+# instead of searching the text once per link.
+def check_links(text, links, nested=None):
+    if not links:
+        return text
+    if nested is None:
+        nested = nested_keys(links)
+    keys = set(key for key in LINKREF_RE.findall(text) if key in links)
+    keys.update(key for key in nested if key in text)
+    linkline = [links[key] for key in sorted(keys)]
     if len(linkline) > 0:
         return text + "\n" + "\n".join(linkline)
     else:
@@ -127,7 +255,7 @@ if __name__ == "__main__":
         "--groups",
         dest="groups",
         type=int,
-        choices=xrange(0, 7),
+        choices=range(0, 7),
         default=0,
         help="group at",
     )
@@ -136,9 +264,17 @@ if __name__ == "__main__":
         "--levels",
         dest="levels",
         type=int,
-        choices=xrange(1, 7),
+        choices=range(1, 7),
         default=1,
         help="no of levels",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=1,
+        help="no of sections to write in parallel",
+    )
     args = parser.parse_args()
     main(vars(args))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""tracing
+  Structured timing events from docxtomd conversions
+  Copyright (c) 2016 by Adam Twardoch, licensed under Apache 2
+  https://github.com/twardoch/markdown-utils
+
+DocxToMdConverter reports each stage of a conversion as an event dict
+to a tracer: any callable that takes one event. Every event has
+'event' (the stage), 'document', 'pid', 'time' (start, epoch seconds),
+'seconds' and 'success', plus stage-specific fields such as byte
+counts, pandoc exit codes and image counts. Media events come from
+worker threads when --jobs > 1, so tracers must be thread-safe.
+
+Stages, in order:
+  paths               output paths and working folder
+  manifest            --incremental: 'action' is skip, media or full
+  pandoc_docx_to_json pandoc pass 1
+  media               all media: 'types' counts images by output type,
+                      'exitcodes' the exit codes of java -jar wmf2svg
+                      runs; one media_file event per conversion, with
+                      'converter' (cache, worker or java) and 'exitcode'
+  svg_optimize        --compress-svg, within media; 'files' lists the
+                      bytes before and after and the seconds of each SVG
+  png_optimize        --optimize-png, within media; as svg_optimize
+  pandoc_json_to_md   pandoc pass 2 with the image filters; with -F,
+                      'placements' counts images hardlinked, cloned or copied
+  html                --html
+  document            the whole conversion, always last
+
+Usage in Python:
+  from mdutils import docxtomd, tracing
+  events = []
+  docxtomd.DocxToMdConverter(
+      inputpath='in.docx', tracer=events.append).convertDocxToMd()
+  docxtomd.DocxToMdConverter(
+      inputpath='in.docx', tracer=tracing.JsonLinesTracer('trace.jsonl')
+  ).convertDocxToMd()
+"""
+
+__version__ = "0.4.5"
+
+import json
+import os
+import threading
+import warnings
+
+
+class JsonLinesTracer:
+    """
+    Append events to a file, one JSON object per line. Each event is
+    written with a single write() to a file opened for appending, so
+    concurrent conversions, also in other processes, can share a file.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): trace file, created if needed
+        """
+        self.path = os.path.realpath(path)
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        line = (json.dumps(event, sort_keys=True) + "\n").encode("utf-8")
+        with self.lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+
+def emit(tracer, event):
+    """
+    Pass an event to a tracer. A failing tracer is reported, but does
+    not stop the conversion.
+    """
+    try:
+        tracer(event)
+    except Exception as e:
+        warnings.warn("Tracer failed: %s" % (e))
@@ -11,107 +11,606 @@ Usage in shell:
   ["png", "./bitmapout.png"]
 
 Usage in Python:
-  from mdutils import wmftosvgpng
+  from mdutils import mediacache, wmftosvgpng
   outputtype, outputpath = wmftosvgpng.toSvgOrPng(**{
       'inputpath': 'vectorin.wmf', 'outputbase': 'vectorout',
       'compress': True, 'verbose': True, 'remove': True,
-      'with_wmf2svg': '/usr/local/java/wmf2svg.jar'
+      'with_wmf2svg': '/usr/local/java/wmf2svg.jar',
+      'cache': mediacache.MediaCache('~/.cache/mdutils')  # optional
   })
+
+  # Convert many files with one JVM (needs Java 11+)
+  with wmftosvgpng.Wmf2SvgWorker('/usr/local/java/wmf2svg.jar') as worker:
+      for path in paths:
+          wmftosvgpng.toSvgOrPng(**{
+              'inputpath': path, 'outputbase': os.path.splitext(path)[0],
+              'compress': False, 'verbose': False, 'remove': False,
+              'worker': worker
+          })
+
+  # Convert WMF data in memory, e.g. straight from a .docx zip
+  with wmftosvgpng.Wmf2SvgWorker('/usr/local/java/wmf2svg.jar') as worker:
+      outputtype, data = wmftosvgpng.convertWmf(wmf, worker=worker)
+
+  # Optimize many SVG files in place with scour, in 4 processes
+  for result in wmftosvgpng.optimizeSvgFiles(paths, 'max', processes=4):
+      print(result['path'], result['bytes_in'], result['bytes_out'])
 """
 
-__version__ = "0.4.4"
+__version__ = "0.4.5"
 WMF2SVG = "/usr/local/java/wmf2svg.jar"
 
 import argparse
 import base64
+import binascii
+import hashlib
 import json
 import os
+import re
+import select
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
 import warnings
-import xml.dom.minidom
+import xml.parsers.expat
+
+from mdutils import mediacache, mediaoptimize
 
 try:
-    import scour.scour
+    import queue
 except ImportError:
-    pass
+    import Queue as queue
+
+WMF2SVG_BATCH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "Wmf2SvgBatch.java"
+)
+# Seconds a wmf2svg worker may take for one conversion
+WORKER_TIMEOUT = 120
+
+
+# scour options of the SVG optimization presets, from fastest to smallest
+SVG_PRESET_DEFAULT = {
+    "strip_ids": True,
+    "shorten_ids": True,
+    "shorten_ids_prefix": "",
+    "simple_colors": True,
+    "strip_comments": True,
+    "error_on_flowtext": False,
+    "remove_metadata": True,
+    "remove_titles": True,
+    "remove_descriptions": True,
+    "group_create": True,
+    "group_collapse": True,
+    "protect_ids_noninkscape": False,
+    "indent_type": "space",
+    "indent_depth": 1,
+    "newlines": True,
+    "keep_editor_data": False,
+    "keep_defs": False,
+    "renderer_workaround": True,
+    "style_to_xml": True,
+    "enable_viewboxing": True,
+    "digits": 5,
+    "embed_rasters": True,
+    "strip_xml_prolog": False,
+    "remove_descriptive_elements": False,
+    "strip_xml_space_attribute": False,
+}
+SVG_PRESETS = {
+    # Only drops what needs no tree analysis
+    "fast": dict(
+        SVG_PRESET_DEFAULT,
+        strip_ids=False,
+        shorten_ids=False,
+        group_create=False,
+        group_collapse=False,
+        indent_type="none",
+        newlines=False,
+    ),
+    "default": SVG_PRESET_DEFAULT,
+    # Also lowers the coordinate precision
+    "max": dict(
+        SVG_PRESET_DEFAULT,
+        digits=4,
+        indent_type="none",
+        newlines=False,
+        strip_xml_prolog=True,
+        remove_descriptive_elements=True,
+        strip_xml_space_attribute=True,
+    ),
+}
+
 
+def svgPreset(compress):
+    """
+    Args:
+        compress (bool|str): False, True or a name in SVG_PRESETS
 
-def optimizeSvg(svg):
+    Returns:
+        str: the preset name, 'default' for True, or None for no
+        optimization
+    """
+    if not compress:
+        return None
+    if compress in SVG_PRESETS:
+        return compress
+    return "default"
+
+
+def optimizeSvg(svg, preset="default"):
+    """
+    Optimize SVG with scour.
+
+    Args:
+        svg (bytes|str): SVG
+        preset (str): name in SVG_PRESETS
+
+    Returns:
+        bytes: the optimized SVG, or the input if scour fails or makes
+        it larger
+    """
+    if not isinstance(svg, bytes):
+        svg = svg.encode("utf-8")
     try:
-        scopts = {
-            "verbose": False,
-            "strip_ids": True,
-            "shorten_ids": True,
-            "simple_colors": True,
-            "strip_comments": True,
-            "error_on_flowtext": False,
-            "remove_metadata": True,
-            "remove_titles": True,
-            "outfilename": None,
-            "group_create": True,
-            "protect_ids_noninkscape": False,
-            "indent_type": "space",
-            "newlines": True,
-            "keep_editor_data": False,
-            "shorten_ids_prefix": "",
-            "indent_depth": 1,
-            "keep_defs": False,
-            "renderer_workaround": True,
-            "remove_descriptions": True,
-            "style_to_xml": True,
-            "protect_ids_prefix": None,
-            "enable_viewboxing": True,
-            "digits": 5,
-            "embed_rasters": True,
-            "infilename": None,
-            "strip_xml_prolog": False,
-            "group_collapse": True,
-            "quiet": False,
-            "remove_descriptive_elements": False,
-            "strip_xml_space_attribute": False,
-            "protect_ids_list": None,
-        }
-        svg = scour.scour.scourString(svg, scopts).encode("utf-8")
-    except:
+        # Imported on first use, it is slow to load
+        import scour.scour
+    except ImportError:
         warnings.warn("scour not installed, run: pip install --user scour")
-    return svg
+        return svg
+    try:
+        scopts = scour.scour.generateDefaultOptions()
+        for key, value in SVG_PRESETS[svgPreset(preset)].items():
+            setattr(scopts, key, value)
+        scopts.quiet = True
+        optimized = scour.scour.scourString(svg, scopts).encode("utf-8")
+    except Exception:
+        warnings.warn("Cannot optimize SVG!")
+        return svg
+    if len(optimized) >= len(svg):
+        return svg
+    return optimized
 
 
-def getPngOrSvg(svg):
+def scourVersion():
     try:
-        doc = xml.dom.minidom.parseString(svg)
-        root = doc.documentElement
-        isPng = False
-        if (
-            len(root.getElementsByTagName("polygon"))
-            + len(root.getElementsByTagName("path"))
-            + len(root.getElementsByTagName("polyline"))
-            == 0
-        ):
-            images = root.getElementsByTagName("image")
-            if len(images) == 1:
-                isPng = True
-            elif len(images) > 0:
-                isPng = True
-                for ei, e1 in enumerate(images[1:]):
-                    e0 = images[ei - 1]
-                    if e0.toxml() != e1.toxml():
-                        isPng = False
-        if isPng:
-            png64 = root.getElementsByTagName("image")[0].getAttribute("xlink:href")
-            png = base64.decodestring(png64[22:])
-            return True, png
-        else:
-            for node in doc.getElementsByTagName("svg"):
-                node.setAttribute("height", "")
-                node.removeAttribute("height")
-                node.setAttribute("width", "")
-                node.removeAttribute("width")
-                node.setAttribute("preserveAspectRatio", "xMidYMid meet")
-            return False, doc.toxml()
-    except:
+        import scour
+    except ImportError:
+        return None
+    return getattr(scour, "__version__", "unknown")
+
+
+def svgCacheFields(preset):
+    """
+    Returns:
+        dict: what identifies SVG optimized with preset in the cache
+    """
+    return {"converter": "scour", "preset": svgPreset(preset), "scour": scourVersion()}
+
+
+def optimizeSvgFile(path, preset="default", cache=None):
+    """
+    Optimize an SVG file in place with scour, see
+    mediaoptimize.optimizeFile().
+
+    Args:
+        path (str): .svg file
+        preset (str): name in SVG_PRESETS
+        cache (mediacache.MediaCache): optional cache of optimized SVG
+
+    Returns:
+        dict: path, bytes_in, bytes_out, seconds, cached
+    """
+    return mediaoptimize.optimizeFile(
+        path, optimizeSvg, preset, cache, svgCacheFields(preset)
+    )
+
+
+def optimizeSvgFiles(paths, preset="default", processes=1, cache=None, pool=None):
+    """
+    Optimize many SVG files in place with scour, in a pool of processes
+    since scour is pure Python, see mediaoptimize.optimizeFiles().
+
+    Args:
+        paths (list): .svg files
+        preset (str): name in SVG_PRESETS
+        processes (int): max number of processes
+        cache (mediacache.MediaCache): optional cache of optimized SVG
+        pool (multiprocessing.pool.Pool): optional pool to run in
+
+    Returns:
+        list: optimizeSvgFile() results in the same order as paths
+    """
+    return mediaoptimize.optimizeFiles(
+        optimizeSvg, paths, preset, processes, cache, pool, svgCacheFields(preset)
+    )
+
+
+VECTOR_TAGS = ("polygon", "path", "polyline")
+# Bitmaps that are extracted from an SVG that only wraps one
+DATA_URI_TYPES = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/gif": ".gif",
+}
+# Characters of base64 decoded at once, a multiple of 4
+BASE64_CHUNK = 65536
+SVG_TAG_RE = re.compile(br"<svg\b[^>]*>")
+SVG_SIZE_RE = re.compile(
+    br"\s(?:width|height|preserveAspectRatio)\s*=\s*(?:\"[^\"]*\"|'[^']*')"
+)
+
+
+class VectorFound(Exception):
+    pass
+
+
+def classifySvg(svg):
+    """
+    Decide in one streaming pass whether wmf2svg output is a vector
+    drawing or just a wrapper around one bitmap. Parsing stops at the
+    first vector element; <image> elements are compared by a hash of
+    their decoded bitmap and their other attributes.
+
+    Args:
+        svg (bytes): SVG document
+
+    Returns:
+        tuple: (True, None, None) if it has vector elements,
+        (False, extension, bitmap) if it only holds copies of one
+        bitmap in a data: URI of a type in DATA_URI_TYPES,
+        (False, None, None) otherwise
+    """
+    images = set()
+    bitmaps = []
+
+    def startElement(name, attrs):
+        if name in VECTOR_TAGS:
+            raise VectorFound()
+        if name == "image":
+            href = attrs.get("xlink:href", "")
+            ext, bitmap = decodeDataUri(href)
+            digest = hashlib.sha1()
+            for key in sorted(attrs):
+                if key != "xlink:href":
+                    digest.update(("%s=%s\n" % (key, attrs[key])).encode("utf-8"))
+            # The decoded bitmap, not another copy of the payload text
+            digest.update(bitmap if ext else href.encode("utf-8"))
+            images.add(digest.digest())
+            if not bitmaps:
+                bitmaps.append((ext, bitmap))
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = startElement
+    try:
+        parser.Parse(svg, True)
+    except VectorFound:
+        return True, None, None
+    if len(images) == 1 and bitmaps[0][0]:
+        return (False,) + bitmaps[0]
+    return False, None, None
+
+
+def stripSvgSize(svg):
+    """
+    Remove width and height from the root <svg> tag so that the drawing
+    scales to its container, without parsing the whole document.
+    """
+    match = SVG_TAG_RE.search(svg)
+    if not match:
+        return svg
+    tag = SVG_SIZE_RE.sub(b"", match.group(0))
+    end = -2 if tag.endswith(b"/>") else -1
+    tag = tag[:end] + b' preserveAspectRatio="xMidYMid meet"' + tag[end:]
+    return svg[: match.start()] + tag + svg[match.end() :]
+
+
+def decodeBase64(text, start=0):
+    """
+    Decode text[start:] in chunks of BASE64_CHUNK characters, so that
+    the payload of a large data: URI is never copied as a whole.
+
+    Returns:
+        bytes: decoded data
+    """
+    for space in " \t\r\n":
+        if text.find(space, start) >= 0:
+            # Chunks must hold whole groups of 4 characters
+            return base64.b64decode(re.sub(r"\s+", "", text[start:]))
+    return b"".join(
+        binascii.a2b_base64(text[offset : offset + BASE64_CHUNK])
+        for offset in range(start, len(text), BASE64_CHUNK)
+    )
+
+
+def decodeDataUri(href):
+    """
+    Args:
+        href (str): xlink:href of an <image>
+
+    Returns:
+        tuple: (extension, bytes) for a base64 data: URI of a type in
+        DATA_URI_TYPES, otherwise (None, None)
+    """
+    comma = href.find(",")
+    if not href.startswith("data:") or comma < 0:
+        return (None, None)
+    params = href[5:comma].split(";")
+    ext = DATA_URI_TYPES.get(params[0].strip().lower())
+    if not ext or "base64" not in params[1:]:
+        return (None, None)
+    # Only the payload after the comma, whatever the length of the header
+    return (ext, decodeBase64(href, comma + 1))
+
+
+def getBitmapOrSvg(svg):
+    """
+    Args:
+        svg (bytes|str): wmf2svg output
+
+    Returns:
+        tuple: (extension, bitmap) if the SVG only wraps one embedded
+        PNG, JPEG or GIF, otherwise ('.svg', SVG without a fixed size)
+    """
+    if not isinstance(svg, bytes):
+        svg = svg.encode("utf-8")
+    try:
+        isVector, ext, bitmap = classifySvg(svg)
+        if ext:
+            return (ext, bitmap)
+        return (".svg", stripSvgSize(svg))
+    except Exception:
         warnings.warn("Cannot analyze SVG!")
-        return False, svg
+        return (".svg", svg)
+
+
+def getPngOrSvg(svg):
+    """
+    Returns:
+        tuple: (True, png) if the SVG only wraps one PNG, otherwise
+        (False, svg), see getBitmapOrSvg()
+    """
+    ext, buffer = getBitmapOrSvg(svg)
+    if ext == ".png":
+        return (True, buffer)
+    if ext == ".svg":
+        return (False, buffer)
+    if not isinstance(svg, bytes):
+        svg = svg.encode("utf-8")
+    return (False, stripSvgSize(svg))
+
+
+class WorkerTimeout(Exception):
+    pass
+
+
+class Wmf2SvgWorker:
+    """
+    Long-lived wmf2svg JVMs that convert many WMF files, so a document
+    or a whole batch pays JVM startup once instead of once per file.
+    Requests go through Wmf2SvgBatch.java on stdin/stdout. Up to `size`
+    JVMs are started on demand when conversions run in parallel threads.
+    If a JVM cannot be started or dies, conversions fall back to one
+    `java -jar` run per file. A JVM that does not answer within
+    `timeout` seconds is killed, that file fails, and a new JVM is
+    started for the next one.
+    """
+
+    def __init__(self, wmf2svg=WMF2SVG, size=1, timeout=WORKER_TIMEOUT):
+        """
+        Args:
+            wmf2svg (str): path to 'wmf2svg.jar'
+            size (int): max number of JVMs running at once
+            timeout (float): max seconds to wait for one conversion
+        """
+        self.wmf2svg = wmf2svg
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.processes = []
+        self.idle = queue.Queue()
+        self.failed = False
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        args = [
+            "java",
+            "-Djava.awt.headless=true",
+            "-cp",
+            self.wmf2svg,
+            WMF2SVG_BATCH,
+        ]
+        # subprocess.DEVNULL is Python 3 only
+        devnull = getattr(subprocess, "DEVNULL", None)
+        stderr = devnull if devnull is not None else open(os.devnull, "wb")
+        try:
+            process = subprocess.Popen(
+                args,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+            )
+        except OSError:
+            warnings.warn("Cannot start wmf2svg worker, converting one by one")
+            self.failed = True
+            return None
+        finally:
+            if devnull is None:
+                stderr.close()
+        self.processes.append(process)
+        return process
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                if self.failed:
+                    return None
+                if self.idle.empty() and len(self.processes) < self.size:
+                    return self.start()
+            process = self.idle.get()
+            if process is not None:
+                return process
+            # Woken up after a JVM was removed: start another, or wait
+
+    def remove(self, process):
+        with self.lock:
+            if process in self.processes:
+                self.processes.remove(process)
+        self.stop(process, kill=True)
+        # Wake up a thread waiting for an idle JVM
+        self.idle.put(None)
+
+    def receive(self, process):
+        """
+        Read one reply within self.timeout seconds, straight from the
+        file descriptor so that select() sees all pending data.
+
+        Returns:
+            tuple: (reply, data) as in call()
+        """
+        fd = process.stdout.fileno()
+        deadline = time.time() + self.timeout
+
+        def read():
+            remaining = deadline - time.time()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise WorkerTimeout()
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise EOFError()
+            return chunk
+
+        buffer = b""
+        while b"\n" not in buffer:
+            buffer += read()
+        line, buffer = buffer.split(b"\n", 1)
+        reply = line.decode("utf-8").rstrip()
+        if not reply.startswith("OK\t"):
+            return (reply, b"")
+        length = int(reply[3:])
+        chunks = [buffer]
+        received = len(buffer)
+        while received < length:
+            chunk = read()
+            chunks.append(chunk)
+            received += len(chunk)
+        return ("OK", b"".join(chunks))
+
+    def call(self, request, payload=b""):
+        """
+        Send one request to an idle JVM.
+
+        Args:
+            request (str): request line, see Wmf2SvgBatch.java
+            payload (bytes): data following the request line
+
+        Returns:
+            tuple: (reply, data) where reply is 'OK' or 'ERROR message'
+            and data is the payload of an 'OK<TAB>length' reply, or None
+            if no JVM is available
+        """
+        process = self.acquire()
+        if not process:
+            return None
+        try:
+            process.stdin.write(request.encode("utf-8") + payload)
+            process.stdin.flush()
+            reply, data = self.receive(process)
+        except WorkerTimeout:
+            warnings.warn(
+                "wmf2svg worker did not answer in %ss, restarting it" % (self.timeout)
+            )
+            self.remove(process)
+            return ("ERROR timed out", b"")
+        except (EOFError, IOError, OSError, ValueError):
+            reply = ""
+        if reply:
+            self.idle.put(process)
+            return (reply, data)
+        warnings.warn("wmf2svg worker died, converting one by one")
+        with self.lock:
+            self.failed = True
+        self.remove(process)
+        return None
+
+    def convert(self, inputpath, outputpath, status=None):
+        """
+        Args:
+            inputpath (str): input.wmf path
+            outputpath (str): output.svg path
+            status (dict): optional, receives how the file was converted,
+                see toSvgOrPng()
+
+        Returns:
+            tuple: (True, None) on success, (False, error) otherwise
+        """
+        # Paths go after the request line, so they may hold tabs or
+        # newlines
+        paths = [path.encode("utf-8") for path in (inputpath, outputpath)]
+        result = self.call(
+            "FILES\t%d\t%d\n" % (len(paths[0]), len(paths[1])), b"".join(paths)
+        )
+        if result:
+            setStatus(status, converter="worker")
+            reply, data = result
+            if reply == "OK":
+                return (True, None)
+            return (False, reply[len("ERROR ") :])
+        return toSvg(
+            inputpath=inputpath,
+            outputbase=os.path.splitext(outputpath)[0],
+            with_wmf2svg=self.wmf2svg,
+            status=status,
+        )
+
+    def convertData(self, wmf, status=None):
+        """
+        Convert WMF bytes through the pipes, without files.
+
+        Args:
+            wmf (bytes): WMF data
+            status (dict): optional, see convert()
+
+        Returns:
+            tuple: (svg, None) on success, (None, error) otherwise
+        """
+        result = self.call("DATA\t%d\n" % (len(wmf)), wmf)
+        if result:
+            setStatus(status, converter="worker")
+            reply, data = result
+            if reply == "OK":
+                return (data, None)
+            return (None, reply[len("ERROR ") :])
+        return wmfDataToSvg(wmf, self.wmf2svg, status)
+
+    def stop(self, process, kill=False):
+        try:
+            if kill:
+                process.kill()
+            process.stdin.close()
+            process.wait()
+            process.stdout.close()
+        except (IOError, OSError):
+            pass
+
+    def close(self):
+        with self.lock:
+            processes, self.processes = self.processes, []
+            self.idle = queue.Queue()
+        for process in processes:
+            self.stop(process)
+
+
+def setStatus(status, **fields):
+    if status is not None:
+        status.update(fields)
 
 
 def toSvg(**opts):
@@ -119,6 +618,8 @@ def toSvg(**opts):
     outputpath = os.path.realpath(opts["outputbase"] + ".svg")
     if not os.path.exists(inputpath):
         return (False, "No file: %s" % (inputpath))
+    elif opts.get("worker"):
+        return opts["worker"].convert(inputpath, outputpath, opts.get("status"))
     else:
         args = [
             "java",
@@ -136,36 +637,168 @@ def toSvg(**opts):
             stderr=subprocess.PIPE,
         )
         stdout, stderr = p.communicate(None)
+        setStatus(opts.get("status"), converter="java", exitcode=p.returncode)
         if stderr or p.returncode:
             return (False, stderr)
         else:
             return (True, None)
 
 
-def toSvgOrPng(**opts):
-    success, err = toSvg(**opts)
+def wmfDataToSvg(wmf, wmf2svg=WMF2SVG, status=None):
+    """
+    Convert WMF bytes with one `java -jar` run, through a private
+    temporary folder since wmf2svg.jar only reads and writes files.
+
+    Returns:
+        tuple: (svg, None) on success, (None, error) otherwise
+    """
+    tmpfolder = tempfile.mkdtemp(prefix="wmftosvgpng-")
+    try:
+        inputpath = os.path.join(tmpfolder, "input.wmf")
+        with open(inputpath, "wb") as wmffile:
+            wmffile.write(wmf)
+        outputbase = os.path.join(tmpfolder, "output")
+        success, err = toSvg(
+            inputpath=inputpath,
+            outputbase=outputbase,
+            with_wmf2svg=wmf2svg,
+            status=status,
+        )
+        if err:
+            return (None, err)
+        with open(outputbase + ".svg", "rb") as svgfile:
+            return (svgfile.read(), None)
+    except (IOError, OSError) as e:
+        return (None, str(e))
+    finally:
+        shutil.rmtree(tmpfolder, ignore_errors=True)
+
+
+def convertWmf(wmf, **opts):
+    """
+    Convert WMF data in memory. With a worker, the WMF and the SVG only
+    travel through pipes; nothing is written to disk.
+
+    Args:
+        wmf (bytes): WMF data
+        **opts: 'compress', 'worker', 'with_wmf2svg', 'status' as in
+            toSvgOrPng()
+
+    Returns:
+        tuple: ('.svg', '.png', '.jpg' or '.gif', bytes) or (None, None)
+        on failure
+    """
+    wmf = bytes(wmf)
+    if opts.get("worker"):
+        svg, err = opts["worker"].convertData(wmf, opts.get("status"))
+    else:
+        svg, err = wmfDataToSvg(
+            wmf, opts.get("with_wmf2svg", WMF2SVG), opts.get("status")
+        )
     if err:
         warnings.warn(err)
         return (None, None)
-    svg = file(opts["outputbase"] + ".svg").read()
-    isPng, buffer = getPngOrSvg(svg)
-    returntype = None
-    returnpath = None
-    if isPng:
-        returntype = ".png"
-        returnpath = os.path.realpath(opts["outputbase"] + returntype)
-        outfile = file(returnpath, "wb")
-        outfile.write(buffer)
-        outfile.close()
-        os.remove(opts["outputbase"] + ".svg")
-    else:
-        if opts["compress"]:
-            svg = optimizeSvg(svg)
-        returntype = ".svg"
-        returnpath = os.path.realpath(opts["outputbase"] + returntype)
-        outfile = file(returnpath, "w")
-        outfile.write(buffer)
-        outfile.close()
+    return finishSvg(svg, **opts)
+
+
+def finishSvg(svg, **opts):
+    """
+    Returns:
+        tuple: the bitmap that the wmf2svg output wraps, or the SVG,
+        optimized if opts['compress'] is set, see getBitmapOrSvg()
+    """
+    ext, buffer = getBitmapOrSvg(svg)
+    if ext != ".svg":
+        return (ext, buffer)
+    if opts.get("compress"):
+        buffer = optimizeSvg(buffer, svgPreset(opts["compress"]))
+    return (".svg", buffer)
+
+
+def convertWmfFile(**opts):
+    """
+    Convert the WMF file opts['inputpath'] with one `java -jar` run,
+    which writes outputbase.svg itself, without a temporary copy. The
+    .svg is removed if it only wraps a bitmap.
+
+    Returns:
+        tuple: as convertWmf()
+    """
+    svgpath = os.path.realpath(opts["outputbase"] + ".svg")
+    success, err = toSvg(
+        inputpath=opts["inputpath"],
+        outputbase=opts["outputbase"],
+        with_wmf2svg=opts.get("with_wmf2svg", WMF2SVG),
+        status=opts.get("status"),
+    )
+    try:
+        if not success:
+            raise IOError(err or "wmf2svg failed")
+        with open(svgpath, "rb") as svgfile:
+            svg = svgfile.read()
+    except (IOError, OSError) as e:
+        warnings.warn("Cannot convert %s: %s" % (opts["inputpath"], e))
+        return (None, None)
+    ext, buffer = finishSvg(svg, **opts)
+    if ext != ".svg":
+        os.remove(svgpath)
+    return (ext, buffer)
+
+
+def cacheKey(cache, wmf, opts):
+    """
+    Args:
+        cache (mediacache.MediaCache): media cache
+        wmf (bytes): WMF data
+        opts (dict): toSvgOrPng options
+
+    Returns:
+        str: cache key for the WMF data and the options
+    """
+    return cache.key(
+        wmf,
+        converter="wmftosvgpng",
+        version=__version__,
+        compress=svgPreset(opts.get("compress")) or False,
+        wmf2svg=mediacache.toolVersion(opts.get("with_wmf2svg", WMF2SVG)),
+    )
+
+
+def toSvgOrPng(**opts):
+    """
+    Convert opts['inputpath'] to opts['outputbase'] + '.svg', or to a
+    bitmap if the WMF only holds one. If opts['status'] is a dict, it
+    receives 'converter': 'cache', 'worker' or 'java', and for java
+    runs the 'exitcode' of the java process.
+
+    Returns:
+        tuple: (extension, path) or (None, None) on failure
+    """
+    # The WMF data is only read for the cache key and for the worker's
+    # pipes; java -jar reads the file itself
+    wmf = None
+    try:
+        if opts.get("cache") or opts.get("worker"):
+            with open(opts["inputpath"], "rb") as wmffile:
+                wmf = wmffile.read()
+        elif not os.path.isfile(opts["inputpath"]):
+            raise IOError()
+    except (IOError, OSError):
+        warnings.warn("No file: %s" % (opts["inputpath"]))
+        return (None, None)
+    cache = opts.get("cache")
+    cachekey = cacheKey(cache, wmf, opts) if cache else None
+    returntype, returnpath = None, None
+    if cachekey:
+        returntype, returnpath = cache.fetch(cachekey, opts["outputbase"])
+        if returntype:
+            setStatus(opts.get("status"), converter="cache")
+    if not returntype:
+        returntype, returnpath = convertSvgOrPng(wmf, **opts)
+        if not returntype:
+            return (None, None)
+        if cachekey:
+            cache.store(cachekey, returnpath)
     if opts["remove"] and returntype and returnpath:
         try:
             os.remove(opts["inputpath"])
@@ -176,6 +809,24 @@ def toSvgOrPng(**opts):
     return (returntype, returnpath)
 
 
+def convertSvgOrPng(wmf, **opts):
+    """
+    Convert WMF data and write only the final .svg or .png file. Without
+    a worker, or without wmf data, the file opts['inputpath'] is
+    converted by java -jar in place.
+    """
+    if opts.get("worker") and wmf is not None:
+        returntype, buffer = convertWmf(wmf, **opts)
+    else:
+        returntype, buffer = convertWmfFile(**opts)
+    if not returntype:
+        return (None, None)
+    returnpath = os.path.realpath(opts["outputbase"] + returntype)
+    with open(returnpath, "wb") as outfile:
+        outfile.write(buffer)
+    return (returntype, returnpath)
+
+
 def parseOptions():
     parser = argparse.ArgumentParser(
         description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
@@ -190,6 +841,14 @@ def parseOptions():
     parser.add_argument(
         "-c", "--compress", action="store_true", default=False, help="compress SVG"
     )
+    parser.add_argument(
+        "-p",
+        "--preset",
+        choices=sorted(SVG_PRESETS),
+        default="default",
+        help="SVG compression preset, from fastest to smallest: fast, default, "
+        "max (lowers precision); default: default",
+    )
     parser.add_argument(
         "-r",
         "--remove",
@@ -211,6 +870,9 @@ def parseOptions():
         "--with-wmf2svg", default=WMF2SVG, help="path to 'wmf2svg.jar' binary"
     )
     args = vars(parser.parse_args())
+    if args.pop("compress"):
+        args["compress"] = args["preset"]
+    del args["preset"]
     if not args["outputbase"]:
         args["outputbase"] = os.path.splitext(args["inputpath"])[0]
     return args
@@ -67,13 +67,14 @@ setup(
     # You can just specify the packages manually here if your project is
     # simple. Or you can use find_packages().
     packages=["mdutils"],
+    package_data={"mdutils": ["Wmf2SvgBatch.java"]},
     # List run-time dependencies here.  These will be installed by pip when
     # your project is installed. For an analysis of "install_requires" vs pip's
     # requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=[
         "sh>=1.11",
-        "scour>=0.35",
+        "scour>=0.37",
         "pandocfilters>=1.4.1",
         "Markdown>=2.6.8",
         "pymdown-extensions>=3.1.0",
@@ -91,7 +92,9 @@ setup(
     entry_points={
         "console_scripts": [
             "docxtomd=mdutils.docxtomd:main",
+            "docxtomdbatch=mdutils.docxtomdbatch:main",
             "wmftosvgpng=mdutils.wmftosvgpng:main",
+            "pngoptimize=mdutils.pngoptimize:main",
             "mkdocs2print=mdutils.mkdocs2print:main",
         ],
     },
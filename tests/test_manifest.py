@@ -0,0 +1,76 @@
+import os
+import stat
+import zipfile
+
+from mdutils import manifest
+
+
+def makeZip(path, entries):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    return path
+
+
+def test_fingerprint_separates_text_and_media(tmp_path):
+    a = manifest.inputFingerprint(
+        makeZip(
+            str(tmp_path / "a.docx"),
+            [("word/document.xml", b"<text/>"), ("word/media/image1.png", b"png")],
+        )
+    )
+    media = manifest.inputFingerprint(
+        makeZip(
+            str(tmp_path / "b.docx"),
+            [("word/document.xml", b"<text/>"), ("word/media/image1.png", b"PNG")],
+        )
+    )
+    text = manifest.inputFingerprint(
+        makeZip(
+            str(tmp_path / "c.docx"),
+            [("word/document.xml", b"<TEXT/>"), ("word/media/image1.png", b"png")],
+        )
+    )
+    assert a["texthash"] == media["texthash"]
+    assert a["mediahash"] != media["mediahash"]
+    assert a["texthash"] != text["texthash"]
+    assert a["mediahash"] == text["mediahash"]
+
+
+def test_fingerprint_of_other_files(tmp_path):
+    path = tmp_path / "doc.md"
+    path.write_bytes(b"# Text")
+    fingerprint = manifest.inputFingerprint(str(path))
+    assert fingerprint["size"] == 6
+    path.write_bytes(b"# Next")
+    assert manifest.inputFingerprint(str(path))["texthash"] != fingerprint["texthash"]
+
+
+def test_outputs_present(tmp_path):
+    (tmp_path / "img").mkdir()
+    (tmp_path / "doc.md").write_bytes(b"text")
+    (tmp_path / "img" / "doc_0001.png").write_bytes(b"png")
+    outputs = manifest.outputSizes(
+        str(tmp_path),
+        [str(tmp_path / "doc.md"), str(tmp_path / "img" / "doc_0001.png")],
+    )
+    assert outputs == {"doc.md": 4, os.path.join("img", "doc_0001.png"): 3}
+    assert manifest.outputsPresent(str(tmp_path), outputs)
+    (tmp_path / "doc.md").write_bytes(b"longer text")
+    assert not manifest.outputsPresent(str(tmp_path), outputs)
+    os.remove(str(tmp_path / "img" / "doc_0001.png"))
+    assert not manifest.outputsPresent(str(tmp_path), {"img/doc_0001.png": 3})
+
+
+def test_update(tmp_path):
+    folder = manifest.Manifest(str(tmp_path))
+    assert folder.get("a.md") is None
+    folder.update("a.md", {"converter": "1"})
+    folder.update("b.md", {"converter": "2"})
+    assert folder.get("a.md") == {"converter": "1"}
+    folder.update("a.md", None)
+    assert folder.load() == {"b.md": {"converter": "2"}}
+    # Only the manifest is left, readable as any other output file
+    assert os.listdir(str(tmp_path)) == [manifest.MANIFEST_NAME]
+    mode = stat.S_IMODE(os.stat(folder.path).st_mode)
+    assert mode == 0o666 & ~manifest.UMASK
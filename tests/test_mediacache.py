@@ -0,0 +1,85 @@
+import os
+
+from mdutils import mediacache
+
+
+def makeFile(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def setUsed(cache, key, ext, mtime):
+    os.utime(cache.entryBase(key) + ext, (mtime, mtime))
+
+
+def test_key_is_stable():
+    cache = mediacache.MediaCache.__new__(mediacache.MediaCache)
+    key = cache.key(b"wmf", converter="wmf2svg", compress=False)
+    # Independent of the order of the options, and of the process
+    assert key == cache.key(b"wmf", compress=False, converter="wmf2svg")
+    assert key == "2fc9c9b53f51bfd7d8b782a2a94319cc8b5a146e"
+    assert key != cache.key(b"wmf", converter="wmf2svg", compress=True)
+    assert key != cache.key(b"WMF", converter="wmf2svg", compress=False)
+
+
+def test_store_and_fetch(tmp_path):
+    cache = mediacache.MediaCache(str(tmp_path / "cache"))
+    key = cache.key(b"wmf")
+    assert cache.fetch(key, str(tmp_path / "miss")) == (None, None)
+    cache.store(key, makeFile(tmp_path / "image1.svg", b"<svg/>"))
+    ext, path = cache.fetch(key, str(tmp_path / "image2"))
+    assert (ext, path) == (".svg", os.path.realpath(str(tmp_path / "image2.svg")))
+    assert open(path, "rb").read() == b"<svg/>"
+    # Never shares the file with an output
+    assert not os.path.samefile(path, cache.entryBase(key) + ".svg")
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = mediacache.MediaCache(str(tmp_path / "cache"), maxsize=300)
+    keys = [cache.key(data) for data in (b"a", b"b", b"c")]
+    for i, key in enumerate(keys):
+        cache.store(key, makeFile(tmp_path / ("%d.png" % i), b"x" * 100))
+        setUsed(cache, key, ".png", 1000 + i)
+    # The oldest entry is fetched, so it becomes the most recently used
+    assert cache.fetch(keys[0], str(tmp_path / "out"))[0] == ".png"
+    cache.maxsize = 250
+    cache.evict()
+    assert cache.fetch(keys[1], str(tmp_path / "out")) == (None, None)
+    assert cache.fetch(keys[2], str(tmp_path / "out"))[0] == ".png"
+    assert cache.fetch(keys[0], str(tmp_path / "out"))[0] == ".png"
+
+
+def test_walks_only_over_the_limit(tmp_path, monkeypatch):
+    cache = mediacache.MediaCache(str(tmp_path / "cache"), maxsize=1000)
+    walks = []
+    walk = os.walk
+
+    def countingWalk(path):
+        walks.append(path)
+        return walk(path)
+
+    monkeypatch.setattr(os, "walk", countingWalk)
+    source = makeFile(tmp_path / "image.png", b"x" * 100)
+    # The first store has no estimate yet
+    cache.store(cache.key(b"0"), source)
+    assert len(walks) == 1
+    # Another process sharing the cache uses the same estimate
+    other = mediacache.MediaCache(str(tmp_path / "cache"), maxsize=1000)
+    for i in range(1, 10):
+        other.store(other.key(b"%d" % i), source)
+    assert len(walks) == 1
+    other.store(other.key(b"10"), source)
+    assert len(walks) == 2
+    assert cache.updateSize() <= 1000 * mediacache.EVICT_TARGET
+
+
+def test_miss_when_evicted_meanwhile(tmp_path, monkeypatch):
+    cache = mediacache.MediaCache(str(tmp_path / "cache"))
+    key = cache.key(b"wmf")
+    cache.store(key, makeFile(tmp_path / "image1.svg", b"<svg/>"))
+    cachedpath = cache.entryBase(key) + ".svg"
+    # Listed by glob, then removed by another process before the copy
+    monkeypatch.setattr(mediacache.glob, "glob", lambda pattern: [cachedpath])
+    os.remove(cachedpath)
+    assert cache.fetch(key, str(tmp_path / "image2")) == (None, None)
+    assert not os.path.exists(str(tmp_path / "image2.svg"))
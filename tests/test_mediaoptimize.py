@@ -0,0 +1,40 @@
+from mdutils import mediacache, mediaoptimize
+
+
+def halve(data, setting):
+    return data[: len(data) // 2]
+
+
+def grow(data, setting):
+    return data + b"!"
+
+
+def test_rewrites_only_if_smaller(tmp_path):
+    path = tmp_path / "image.svg"
+    path.write_bytes(b"<svg/>")
+    result = mediaoptimize.optimizeFile(str(path), grow, "default")
+    assert (result["bytes_in"], result["bytes_out"]) == (6, 6)
+    assert path.read_bytes() == b"<svg/>"
+    result = mediaoptimize.optimizeFile(str(path), halve, "default")
+    assert (result["bytes_in"], result["bytes_out"]) == (6, 3)
+    assert path.read_bytes() == b"<sv"
+
+
+def test_cached_by_fields(tmp_path):
+    cache = mediacache.MediaCache(str(tmp_path / "cache"))
+    paths = []
+    for name in ("a.svg", "b.svg", "c.svg"):
+        path = tmp_path / name
+        path.write_bytes(b"<svg></svg>")
+        paths.append(str(path))
+    results = mediaoptimize.optimizeFiles(
+        halve, paths[:2], "default", cache=cache, cachefields={"converter": "halve"}
+    )
+    assert [result["cached"] for result in results] == [False, True]
+    assert (tmp_path / "b.svg").read_bytes() == b"<svg>"
+    # Other fields, other results
+    result = mediaoptimize.optimizeFile(
+        paths[2], grow, "default", cache, {"converter": "grow"}
+    )
+    assert not result["cached"]
+    assert (tmp_path / "c.svg").read_bytes() == b"<svg></svg>"
@@ -0,0 +1,113 @@
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from mdutils import pandoc_addimgdims, pandoc_pipeline
+
+
+def saveImage(path, format, size=(123, 45), mode="RGB", **params):
+    Image.new(mode, size, "red").save(str(path), format, **params)
+    return str(path)
+
+
+def exif():
+    # A minimal TIFF header with no entries
+    return b"Exif\x00\x00" + b"MM\x00\x2a\x00\x00\x00\x08" + b"\x00\x00"
+
+
+def iccProfile():
+    ImageCms = pytest.importorskip("PIL.ImageCms")
+
+    profile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB"))
+    return profile.tobytes()
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        lambda: {},
+        lambda: {"progressive": True},
+        lambda: {"exif": exif()},
+        lambda: {"icc_profile": iccProfile()},
+    ],
+    ids=["baseline", "progressive", "exif", "icc"],
+)
+def test_jpeg_size(tmp_path, params):
+    path = saveImage(tmp_path / "image.jpg", "JPEG", **params())
+    assert pandoc_addimgdims.jpegSize(path) == (123, 45)
+
+
+def test_jpeg_padded_marker(tmp_path):
+    data = io.BytesIO()
+    Image.new("L", (7, 9)).save(data, "JPEG")
+    data = data.getvalue()
+    # Fill bytes before a marker are allowed
+    path = tmp_path / "image.jpg"
+    path.write_bytes(data[:2] + b"\xff\xff" + data[2:])
+    assert pandoc_addimgdims.jpegSize(str(path)) == (7, 9)
+
+
+def test_png_size(tmp_path):
+    path = saveImage(tmp_path / "image.png", "PNG")
+    assert pandoc_addimgdims.pngSize(path) == (123, 45)
+
+
+def test_gif_size(tmp_path):
+    path = saveImage(tmp_path / "image.gif", "GIF", mode="P")
+    assert pandoc_addimgdims.gifSize(path) == (123, 45)
+
+
+@pytest.mark.parametrize(
+    "root, size",
+    [
+        ('<svg width="120px" height="80.4">', (120, 80)),
+        ('<svg width="10mm" height="5mm" viewBox="0 0 300 150">', (300, 150)),
+        ('<svg viewBox="0,0,64.6,32">', (65, 32)),
+        ('<svg width="100%" height="100%">', None),
+    ],
+)
+def test_svg_size(tmp_path, root, size):
+    path = tmp_path / "image.svg"
+    path.write_text(
+        '<?xml version="1.0"?>\n%s<path d="M0 0L1 1"/></svg>'
+        % root.replace("<svg", '<svg xmlns="http://www.w3.org/2000/svg"')
+    )
+    assert pandoc_addimgdims.svgSize(str(path)) == size
+
+
+@pytest.mark.parametrize(
+    "name, format, cut",
+    [("image.jpg", "JPEG", 20), ("image.png", "PNG", 20), ("image.gif", "GIF", 8)],
+)
+def test_truncated_is_unknown(tmp_path, name, format, cut):
+    data = io.BytesIO()
+    Image.new("P" if format == "GIF" else "RGB", (5, 5)).save(data, format)
+    path = tmp_path / name
+    path.write_bytes(data.getvalue()[:cut])
+    context = pandoc_pipeline.FilterContext()
+    assert pandoc_addimgdims.imageSize(str(path), context) is None
+
+
+def test_image_size_is_memoized(tmp_path):
+    path = saveImage(tmp_path / "image.png", "PNG")
+    context = pandoc_pipeline.FilterContext()
+    assert pandoc_addimgdims.imageSize(path, context) == (123, 45)
+    (tmp_path / "image.png").write_bytes(b"")
+    assert pandoc_addimgdims.imageSize(path, context) == (123, 45)
+
+
+def test_recalc_attrs():
+    attrs = ["id", ["figure"], [["width", "2in"], ["title", "a"], ["height", "1in"]]]
+    assert pandoc_addimgdims.recalcAttrs(attrs, (400, 300), 500) == [
+        "id",
+        ["figure"],
+        [["title", "a"], ["width", "400px"], ["height", "300px"]],
+    ]
+    # Wider than maxdims
+    assert pandoc_addimgdims.recalcAttrs(attrs, (501, 300), 500) == [
+        "id",
+        ["figure"],
+        [["title", "a"], ["width", "100%"]],
+    ]
@@ -0,0 +1,109 @@
+import functools
+import json
+import os
+
+from mdutils import pandoc_addimgdims, pandoc_mapmedia, pandoc_pipeline
+
+
+def makeDoc(*srcs):
+    blocks = []
+    for src in srcs:
+        image = {"t": "Image", "c": [["", [], []], [], [src, ""]]}
+        blocks.append({"t": "Para", "c": [image]})
+    return {"pandoc-api-version": [1, 20], "meta": {}, "blocks": blocks}
+
+
+def imageSrcs(doc):
+    return [block["c"][0]["c"][2][0] for block in doc["blocks"]]
+
+
+def writeMediaInfo(tmp_path, mediamap, dedupe=False, placedpath=None):
+    srcfolder = tmp_path / "media"
+    dstfolder = tmp_path / "img"
+    for folder in (srcfolder, dstfolder):
+        if not folder.exists():
+            folder.mkdir()
+    for fn in mediamap.values():
+        (srcfolder / fn).write_bytes(fn.encode("ascii"))
+    mediainfopath = tmp_path / "doc.media.json"
+    mediainfopath.write_text(
+        json.dumps(
+            {
+                "srcfull": str(srcfolder),
+                "dstfull": str(dstfolder),
+                "prefix": "doc",
+                "srcsubstr": "./media/",
+                "dstsubstr": "img/",
+                "map": mediamap,
+                "dedupe": dedupe,
+                "placedpath": placedpath,
+            }
+        )
+    )
+    return str(mediainfopath)
+
+
+def runFilters(doc, context):
+    return pandoc_pipeline.applyFilters(
+        doc,
+        [
+            functools.partial(pandoc_mapmedia.pandoc_wmftosvgpng, context=context),
+            functools.partial(pandoc_addimgdims.pandoc_addimgdims, context=context),
+        ],
+        "markdown",
+    )
+
+
+def test_compose_filters():
+    def upper(key, value, format, meta):
+        if key == "Str":
+            return {"t": "Str", "c": value.upper()}
+
+    def exclaim(key, value, format, meta):
+        if key == "Str":
+            return {"t": "Str", "c": value + "!"}
+
+    doc = {"meta": {}, "blocks": [{"t": "Para", "c": [{"t": "Str", "c": "a"}]}]}
+    doc = pandoc_pipeline.applyFilters(doc, [upper, exclaim])
+    assert doc["blocks"][0]["c"][0] == {"t": "Str", "c": "A!"}
+
+
+def test_one_context_per_run(tmp_path, monkeypatch):
+    mediainfopath = writeMediaInfo(tmp_path, {"image1.png": "image1.png"})
+    monkeypatch.setenv("pandoc_filter_mapmedia", mediainfopath)
+    doc = runFilters(
+        makeDoc("./media/image1.png"), pandoc_pipeline.FilterContext.fromEnviron()
+    )
+    assert imageSrcs(doc) == ["img/doc_0001.png"]
+    # The same .media.json path, rewritten for the next document
+    writeMediaInfo(tmp_path, {"image1.png": "image1.svg"})
+    doc = runFilters(
+        makeDoc("./media/image1.png"), pandoc_pipeline.FilterContext.fromEnviron()
+    )
+    assert imageSrcs(doc) == ["img/doc_0001.svg"]
+    assert (tmp_path / "img" / "doc_0001.svg").read_bytes() == b"image1.svg"
+
+
+def test_dedupe_places_once(tmp_path):
+    mediainfopath = writeMediaInfo(
+        tmp_path, {"image1.png": "image1.png", "image2.png": "image1.png"}, dedupe=True
+    )
+    context = pandoc_pipeline.FilterContext(mediainfopath)
+    doc = runFilters(makeDoc("./media/image1.png", "./media/image2.png"), context)
+    assert imageSrcs(doc) == ["img/doc_0001.png", "img/doc_0001.png"]
+    assert context.placed == {"doc_0001.png": "image1.png"}
+    assert os.listdir(str(tmp_path / "img")) == ["doc_0001.png"]
+
+
+def test_write_placed(tmp_path):
+    placedpath = str(tmp_path / "placed.json")
+    mediainfopath = writeMediaInfo(
+        tmp_path, {"image1.png": "image1.svg"}, placedpath=placedpath
+    )
+    context = pandoc_pipeline.FilterContext(mediainfopath)
+    runFilters(makeDoc("./media/image1.png"), context)
+    context.writePlaced()
+    with open(placedpath) as placedfile:
+        placed = json.load(placedfile)
+    assert placed["placed"] == {"doc_0001.svg": "image1.png"}
+    assert sum(placed["placements"].values()) == 1
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from mdutils import placefile
+
+
+@pytest.fixture
+def src(tmp_path):
+    path = tmp_path / "src.svg"
+    path.write_bytes(b"<svg/>")
+    return str(path)
+
+
+def noLink(srcpath, dstpath):
+    raise OSError("Invalid cross-device link")
+
+
+def test_link(tmp_path, src):
+    dst = str(tmp_path / "dst.svg")
+    assert placefile.placeFile(src, dst) == "link"
+    assert os.path.samefile(src, dst)
+    # Already in place
+    assert placefile.placeFile(src, dst) is None
+
+
+def test_no_link(tmp_path, src):
+    dst = str(tmp_path / "dst.svg")
+    assert placefile.placeFile(src, dst, link=False) in ("reflink", "copy")
+    assert not os.path.samefile(src, dst)
+    assert open(dst, "rb").read() == b"<svg/>"
+
+
+def test_link_fails(tmp_path, src, monkeypatch):
+    monkeypatch.setattr(os, "link", noLink)
+    dst = str(tmp_path / "dst.svg")
+    assert placefile.placeFile(src, dst) in ("reflink", "copy")
+    assert open(dst, "rb").read() == b"<svg/>"
+
+
+def test_copy(tmp_path, src, monkeypatch):
+    monkeypatch.setattr(os, "link", noLink)
+    monkeypatch.setattr(placefile, "cloneFile", lambda srcpath, dstpath: False)
+    dst = str(tmp_path / "dst.svg")
+    assert placefile.placeFile(src, dst) == "copy"
+    assert open(dst, "rb").read() == b"<svg/>"
+
+
+def test_clone_failure_leaves_nothing(tmp_path, src, monkeypatch):
+    if placefile.fcntl is None:
+        pytest.skip("no fcntl")
+
+    def ioctl(*args):
+        raise OSError("Operation not supported")
+
+    monkeypatch.setattr(placefile.fcntl, "ioctl", ioctl)
+    dst = str(tmp_path / "dst.svg")
+    assert not placefile.cloneFile(src, dst)
+    assert not os.path.exists(dst)
+
+
+def test_replace(tmp_path, src):
+    dst = tmp_path / "dst.svg"
+    dst.write_bytes(b"old")
+    assert placefile.placeFile(src, str(dst), link=False) in ("reflink", "copy")
+    assert dst.read_bytes() == b"<svg/>"
+
+
+def test_shared(tmp_path, src):
+    dst = tmp_path / "0123456789abcdef.svg"
+    assert placefile.placeFile(src, str(dst), shared=True) == "link"
+    assert sorted(os.listdir(str(tmp_path))) == ["0123456789abcdef.svg", "src.svg"]
+    # Named after its contents: an existing file is kept
+    other = tmp_path / "other.svg"
+    other.write_bytes(b"<svg/>")
+    assert placefile.placeFile(str(other), str(dst), shared=True) is None
+    assert os.path.samefile(src, str(dst))
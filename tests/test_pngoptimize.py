@@ -0,0 +1,118 @@
+import io
+import struct
+import zlib
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from mdutils import pngoptimize
+
+
+def makeChunk(kind, body):
+    return (
+        struct.pack(">I", len(body))
+        + kind
+        + body
+        + struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF)
+    )
+
+
+def makePng(width, height, bitdepth, colortype, rows, chunks=()):
+    """
+    Write a PNG by hand, uncompressed, so that there is room to optimize.
+    """
+    ihdr = struct.pack(">IIBBBBB", width, height, bitdepth, colortype, 0, 0, 0)
+    raw = b"".join(b"\x00" + row for row in rows)
+    return (
+        pngoptimize.PNG_SIGNATURE
+        + makeChunk(b"IHDR", ihdr)
+        + b"".join(makeChunk(kind, body) for kind, body in chunks)
+        + makeChunk(b"IDAT", zlib.compress(raw, 0))
+        + makeChunk(b"IEND", b"")
+    )
+
+
+def pixels(data):
+    return Image.open(io.BytesIO(data)).convert("RGBA").tobytes()
+
+
+def chunkTypes(data):
+    return [kind for kind, chunk in pngoptimize.pngChunks(data)]
+
+
+def rgbRows(width, height):
+    return [
+        b"".join(
+            struct.pack(">BBB", x * 8 % 256, y * 8 % 256, 10) for x in range(width)
+        )
+        for y in range(height)
+    ]
+
+
+def test_rgb_is_smaller_and_lossless():
+    data = makePng(32, 32, 8, 2, rgbRows(32, 32))
+    optimized = pngoptimize.optimizePng(data, "max")
+    assert len(optimized) < len(data)
+    assert pixels(optimized) == pixels(data)
+
+
+def test_rgba_palette_is_lossless():
+    rows = [
+        b"".join(
+            struct.pack(">BBBB", 255 * (x % 2), 0, 255 * (y % 2), 128 * (x % 3 == 0))
+            for x in range(32)
+        )
+        for y in range(32)
+    ]
+    data = makePng(32, 32, 8, 6, rows)
+    optimized = pngoptimize.optimizePng(data, "default")
+    assert len(optimized) < len(data)
+    assert pixels(optimized) == pixels(data)
+
+
+def test_16bit_is_unchanged():
+    rows = [
+        b"".join(struct.pack(">HHH", x * 997, y * 991, 12345) for x in range(16))
+        for y in range(16)
+    ]
+    data = makePng(16, 16, 16, 2, rows)
+    assert pngoptimize.optimizePng(data, "max") is data
+
+
+def test_rgb_color_key_is_kept():
+    rows = rgbRows(32, 32)
+    data = makePng(32, 32, 8, 2, rows, [(b"tRNS", struct.pack(">HHH", 0, 8, 10))])
+    optimized = pngoptimize.optimizePng(data, "max")
+    assert len(optimized) < len(data)
+    assert b"tRNS" in chunkTypes(optimized)
+    assert pixels(optimized) == pixels(data)
+
+
+def test_color_chunks_are_kept():
+    chunks = [
+        (b"gAMA", struct.pack(">I", 45455)),
+        (b"sRGB", b"\x00"),
+        (b"pHYs", struct.pack(">IIB", 3780, 3780, 1)),
+        (b"tEXt", b"Comment\x00dropped"),
+    ]
+    data = makePng(32, 32, 8, 2, rgbRows(32, 32), chunks)
+    optimized = pngoptimize.optimizePng(data, "default")
+    kept = dict(pngoptimize.pngChunks(optimized))
+    for kind, body in chunks[:3]:
+        assert kept[kind] == makeChunk(kind, body)
+    assert b"tEXt" not in kept
+    assert chunkTypes(optimized).index(b"gAMA") < chunkTypes(optimized).index(b"IDAT")
+    assert pixels(optimized) == pixels(data)
+
+
+def test_typed_chunks_are_unchanged():
+    data = makePng(
+        32, 32, 8, 2, rgbRows(32, 32), [(b"bKGD", struct.pack(">HHH", 1, 2, 3))]
+    )
+    assert pngoptimize.optimizePng(data, "default") is data
+
+
+def test_not_a_png_is_unchanged():
+    with pytest.warns(UserWarning):
+        assert pngoptimize.optimizePng(b"GIF89a", "fast") == b"GIF89a"
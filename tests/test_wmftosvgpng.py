@@ -0,0 +1,131 @@
+import base64
+import os
+
+import pytest
+
+from mdutils import wmftosvgpng
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(bytearray(range(256))) * 700
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00jpeg" * 10
+
+
+def dataUri(mimetype, data, wrap=None):
+    payload = base64.b64encode(data).decode("ascii")
+    if wrap:
+        payload = "\n".join(payload[i : i + wrap] for i in range(0, len(payload), wrap))
+    return "data:%s;base64,%s" % (mimetype, payload)
+
+
+def makeSvg(*elements):
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" '
+        'xmlns:xlink="http://www.w3.org/1999/xlink" width="10" height="20">'
+        + "".join(elements)
+        + "</svg>"
+    ).encode("utf-8")
+
+
+def image(href, x=0):
+    return '<image x="%d" y="0" width="10" height="20" xlink:href="%s"/>' % (x, href)
+
+
+def test_decode_data_uri():
+    # Larger than one chunk, with any header length
+    assert len(PNG) * 4 // 3 > wmftosvgpng.BASE64_CHUNK
+    assert wmftosvgpng.decodeDataUri(dataUri("image/png", PNG)) == (".png", PNG)
+    assert wmftosvgpng.decodeDataUri(
+        "data:image/jpeg;name=a.jpg;base64," + dataUri("x", JPEG).split(",")[1]
+    ) == (".jpg", JPEG)
+    assert wmftosvgpng.decodeDataUri(dataUri("image/png", PNG, wrap=76)) == (
+        ".png",
+        PNG,
+    )
+
+
+def test_decode_data_uri_unsupported():
+    assert wmftosvgpng.decodeDataUri("img.png") == (None, None)
+    assert wmftosvgpng.decodeDataUri(dataUri("image/bmp", PNG)) == (None, None)
+    assert wmftosvgpng.decodeDataUri("data:image/png,rawdata") == (None, None)
+
+
+def test_single_bitmap():
+    svg = makeSvg(image(dataUri("image/png", PNG)))
+    assert wmftosvgpng.classifySvg(svg) == (False, ".png", PNG)
+    assert wmftosvgpng.getBitmapOrSvg(svg) == (".png", PNG)
+    assert wmftosvgpng.getPngOrSvg(svg) == (True, PNG)
+
+
+def test_copies_of_one_bitmap():
+    href = dataUri("image/jpeg", JPEG)
+    svg = makeSvg(image(href), image(href))
+    assert wmftosvgpng.getBitmapOrSvg(svg) == (".jpg", JPEG)
+
+
+def test_different_bitmaps_stay_svg():
+    svg = makeSvg(image(dataUri("image/png", PNG)), image(dataUri("image/jpeg", JPEG)))
+    assert wmftosvgpng.classifySvg(svg) == (False, None, None)
+    ext, buffer = wmftosvgpng.getBitmapOrSvg(svg)
+    assert ext == ".svg"
+    assert b'width="10"' not in buffer.split(b">")[0]
+
+
+def test_same_bitmap_elsewhere_stays_svg():
+    href = dataUri("image/png", PNG)
+    svg = makeSvg(image(href), image(href, x=10))
+    assert wmftosvgpng.getBitmapOrSvg(svg)[0] == ".svg"
+
+
+def test_vector():
+    svg = makeSvg(image(dataUri("image/png", PNG)), '<path d="M0 0L1 1"/>')
+    assert wmftosvgpng.classifySvg(svg) == (True, None, None)
+    assert wmftosvgpng.getBitmapOrSvg(svg)[0] == ".svg"
+
+
+def test_strip_svg_size():
+    svg = makeSvg('<path d="M0 0L1 1"/>')
+    stripped = wmftosvgpng.stripSvgSize(svg)
+    root = stripped.split(b">")[0]
+    assert b"width=" not in root and b"height=" not in root
+    assert b'preserveAspectRatio="xMidYMid meet"' in root
+    assert stripped.endswith(b'<path d="M0 0L1 1"/></svg>')
+
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks", "stubs")
+
+
+@pytest.fixture
+def stubJava(monkeypatch):
+    """
+    The stand-in for java running wmf2svg, and bench_pipeline to write WMF.
+    """
+    monkeypatch.setenv("PATH", STUBS + os.pathsep + os.environ.get("PATH", ""))
+    monkeypatch.syspath_prepend(os.path.dirname(STUBS))
+    import bench_pipeline
+
+    return bench_pipeline
+
+
+@pytest.mark.parametrize("bitmap, ext", [(False, ".svg"), (True, ".png")])
+def test_wmf_file_to_svg_or_png(tmp_path, stubJava, bitmap, ext):
+    wmfpath = tmp_path / "image1.wmf"
+    wmfpath.write_bytes(stubJava.makeWmf(400, 300, 1, bitmap=bitmap))
+    returntype, returnpath = wmftosvgpng.toSvgOrPng(
+        inputpath=str(wmfpath),
+        outputbase=str(tmp_path / "image1"),
+        remove=True,
+        verbose=False,
+    )
+    assert returntype == ext
+    assert sorted(os.listdir(str(tmp_path))) == ["image1" + ext]
+    if bitmap:
+        assert open(returnpath, "rb").read().startswith(b"\x89PNG")
+
+
+def test_worker_converts_data(stubJava):
+    with wmftosvgpng.Wmf2SvgWorker("wmf2svg.jar") as worker:
+        ext, png = wmftosvgpng.convertWmf(
+            stubJava.makeWmf(400, 300, 1, bitmap=True), worker=worker
+        )
+        assert (ext, png[:4]) == (".png", b"\x89PNG")
+        ext, svg = wmftosvgpng.convertWmf(stubJava.makeWmf(400, 300, 1), worker=worker)
+        assert ext == ".svg" and b"<polygon" in svg